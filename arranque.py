@@ -0,0 +1,68 @@
+"""
+Arranque en frío de la app: mide sus fases (imports, apertura de ChromaDB,
+carga del modelo de embeddings, primera consulta) y precalienta el modelo y
+el índice en un hilo de fondo apenas el proceso ejecuta el script por primera vez.
+Todo es por proceso: los reruns de Streamlit no vuelven a medir ni a precalentar.
+"""
+
+import threading
+import time
+from contextlib import contextmanager
+
+INICIO = time.perf_counter()   # primer import de este módulo (≈ arranque del proceso)
+
+fases = {}                     # fase -> segundos (solo la primera medición de cada una)
+terminado = threading.Event()  # el precalentamiento terminó (bien o mal)
+
+_lock = threading.Lock()
+_hilo = None
+
+
+def registrar(fase, segundos):
+    """Guarda la duración de una fase si es la primera vez que se mide (True si lo era)"""
+    with _lock:
+        if fase in fases:
+            return False
+        fases[fase] = segundos
+        return True
+
+
+@contextmanager
+def medir(fase):
+    inicio = time.perf_counter()
+    try:
+        yield
+    finally:
+        registrar(fase, time.perf_counter() - inicio)
+
+
+def precalentar(pasos):
+    """Corre [(fase, función)] en orden en un hilo de fondo, una sola vez por proceso"""
+    global _hilo
+    with _lock:
+        if _hilo is None:
+            _hilo = threading.Thread(target=_correr, args=(pasos,), name="precalentamiento", daemon=True)
+            _hilo.start()
+    return _hilo
+
+
+def _correr(pasos):
+    try:
+        for fase, funcion in pasos:
+            try:
+                with medir(fase):
+                    funcion()
+            except Exception as e:
+                # La primera pregunta hará el trabajo que falte
+                print(f"⚠️ Precalentamiento: {fase} falló ({e})")
+    finally:
+        registrar("listo desde el arranque", time.perf_counter() - INICIO)
+        terminado.set()
+        print(reporte())
+
+
+def reporte():
+    """Texto con las fases medidas hasta ahora"""
+    with _lock:
+        lineas = [f"   {fase:<28} {segundos:6.2f} s" for fase, segundos in fases.items()]
+    return "⏱️ Arranque en frío:\n" + "\n".join(lineas)
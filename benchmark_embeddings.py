@@ -0,0 +1,114 @@
+"""
+Benchmark de throughput de embeddings (chunks/seg) contra un servidor
+Ollama simulado en localhost. Compara el loop secuencial original con
+el pipeline por lotes de embeddings.py.
+
+Uso:
+    python benchmark_embeddings.py
+    python benchmark_embeddings.py --latencia-ms 30 --por-item-ms 2
+"""
+
+import argparse
+import hashlib
+import json
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from pathlib import Path
+
+import ollama
+
+from embeddings import embed_ollama
+from chunking import dividir_en_chunks
+from preprocess_embeddings import load_txt
+
+DIM = 768  # mismo tamaño que nomic-embed-text
+
+
+def vector_falso(texto):
+    """Embedding determinista a partir del hash del texto"""
+    semilla = hashlib.md5(texto.encode("utf-8")).digest()
+    return [semilla[i % len(semilla)] / 255.0 for i in range(DIM)]
+
+
+def crear_servidor(latencia_ms, por_item_ms):
+    """Servidor HTTP que imita /api/embed y /api/embeddings de Ollama"""
+
+    class Handler(BaseHTTPRequestHandler):
+        def do_POST(self):
+            body = json.loads(self.rfile.read(int(self.headers["Content-Length"])))
+            if self.path == "/api/embed":
+                textos = body["input"] if isinstance(body["input"], list) else [body["input"]]
+                time.sleep((latencia_ms + por_item_ms * len(textos)) / 1000)
+                respuesta = {"model": body["model"], "embeddings": [vector_falso(t) for t in textos]}
+            elif self.path == "/api/embeddings":
+                time.sleep((latencia_ms + por_item_ms) / 1000)
+                respuesta = {"embedding": vector_falso(body["prompt"])}
+            else:
+                self.send_response(404)
+                self.end_headers()
+                return
+            data = json.dumps(respuesta).encode()
+            self.send_response(200)
+            self.send_header("Content-Type", "application/json")
+            self.send_header("Content-Length", str(len(data)))
+            self.end_headers()
+            self.wfile.write(data)
+
+        def log_message(self, *args):
+            pass
+
+    servidor = ThreadingHTTPServer(("127.0.0.1", 0), Handler)
+    threading.Thread(target=servidor.serve_forever, daemon=True).start()
+    return servidor
+
+
+def cargar_chunks(folder_path, limite):
+    """Chunks reales del corpus de documentos/"""
+    chunks = []
+    for file_path in sorted(Path(folder_path).glob("*.txt")):
+        content = load_txt(file_path)
+        if content:
+            chunks.extend(chunk["text"] for chunk in dividir_en_chunks(content))
+    return chunks[:limite] if limite else chunks
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark de embeddings por lotes")
+    parser.add_argument("--docs", default="./documentos", help="Carpeta con los TXT")
+    parser.add_argument("--limite", type=int, default=300, help="Máximo de chunks (0 = todos)")
+    parser.add_argument("--latencia-ms", type=float, default=20, help="Latencia fija por petición")
+    parser.add_argument("--por-item-ms", type=float, default=2, help="Costo por chunk dentro de una petición")
+    args = parser.parse_args()
+
+    chunks = cargar_chunks(args.docs, args.limite)
+    servidor = crear_servidor(args.latencia_ms, args.por_item_ms)
+    host = f"http://127.0.0.1:{servidor.server_address[1]}"
+    client = ollama.Client(host=host)
+
+    print("=" * 60)
+    print("BENCHMARK DE EMBEDDINGS (servidor simulado)")
+    print("=" * 60)
+    print(f"Chunks: {len(chunks)} | Servidor: {host}")
+    print(f"Latencia: {args.latencia_ms} ms/petición + {args.por_item_ms} ms/chunk\n")
+
+    # Línea base: el loop original de process_documents
+    inicio = time.perf_counter()
+    base = [client.embeddings(model="nomic-embed-text", prompt=doc)["embedding"] for doc in chunks]
+    t_base = time.perf_counter() - inicio
+    print(f"{'secuencial (original)':<28} {len(chunks) / t_base:>8.1f} chunks/s")
+
+    for batch_size, workers in [(1, 4), (16, 1), (32, 4), (64, 8)]:
+        inicio = time.perf_counter()
+        resultado = embed_ollama(chunks, batch_size=batch_size, workers=workers, client=client)
+        t = time.perf_counter() - inicio
+        assert resultado == base, "los embeddings por lotes no coinciden con los secuenciales"
+        nombre = f"lotes={batch_size}, workers={workers}"
+        print(f"{nombre:<28} {len(chunks) / t:>8.1f} chunks/s  (x{t_base / t:.1f})")
+
+    servidor.shutdown()
+    print("=" * 60)
+
+
+if __name__ == "__main__":
+    main()
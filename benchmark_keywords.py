@@ -0,0 +1,149 @@
+"""
+Benchmark de extracción de keywords: extractor local vs. LLM (Groq).
+Compara latencia de extracción y calidad de recuperación (hit@k y MRR)
+sobre el corpus de documentos/ usando la colección de ChromaDB.
+
+Uso:
+    python benchmark_keywords.py            # solo modo local si no hay GROQ_API_KEY
+    python benchmark_keywords.py --k 5
+"""
+
+import argparse
+import os
+import statistics
+import time
+
+import chromadb
+
+from embeddings import CachedEmbedder, get_backend, backend_de_coleccion
+from keywords import KeywordExtractor, IDF_FILE, tokenizar, normalizar_texto, contar_coincidencias
+
+# Preguntas con el documento que debería aparecer en los resultados
+CONSULTAS = [
+    ("¿Qué establece el artículo 50 del TUE sobre la retirada de un país?", "Artículo 50"),
+    ("¿Qué decía la carta de la primera ministra al presidente del Consejo Europeo?", "Carta de 29 de marzo"),
+    ("Dimensiones, actores y niveles del regionalismo", "DIMENSIONES, ACTORES"),
+    ("¿Qué es la gobernanza supranacional?", "Gobernanza Supranacional"),
+    ("¿Qué plantea el intergubernamentalismo liberal de Moravcsik?", "Intergubernamentalismo Liberal"),
+    ("Implicaciones geopolíticas del Brexit para la Unión Europea", "Implicaciones geopolíticas"),
+    ("Impacto del Brexit en el comercio y el mercado laboral del Reino Unido", "The impact of Brexit"),
+    ("Nuevas tarifas de importación después del Brexit", "New Brexit import fees"),
+    ("Oportunidades para las empresas españolas tras el Brexit", "El Brexit trae problemas"),
+    ("Transterritorialidad del Estado-nación mexicano", "Transterritorialidad del Estado"),
+    ("Desafíos de gobernabilidad en América del Norte", "desafios de gobernabilidad"),
+    ("Desafíos políticos y de seguridad en América Latina", "desafios políticos y de seguridad"),
+    ("Desafíos sociales y económicos de América del Norte", "Desafios sociales y económicos"),
+    ("Consecuencias económico-sociales del Brexit e integridad europea", "Brexit y sus consecuencias"),
+]
+
+LLM_PROMPT = """Extrae SOLO las palabras clave más importantes de la siguiente pregunta.
+Ignora palabras como: qué, es, el, la, de, en, etc.
+Enfócate en: nombres propios, términos técnicos, conceptos importantes.
+
+Pregunta: {query}
+
+Responde SOLO con las palabras clave separadas por comas, sin explicación adicional.
+Ejemplo: "tratado, maastricht" o "brexit, consecuencias" o "mercosur"
+"""
+
+
+def extraer_llm(groq_client, query):
+    """Misma extracción que RAGSystem.extract_keywords_llm"""
+    response = groq_client.chat.completions.create(
+        model="llama-3.1-8b-instant",
+        messages=[{"role": "user", "content": LLM_PROMPT.format(query=query)}],
+        temperature=0.0,
+        max_tokens=50
+    )
+    texto = response.choices[0].message.content.strip()
+    keywords = [" ".join(tokenizar(kw)) for kw in texto.split(',')]
+    return [kw for kw in keywords if kw]
+
+
+def reordenar(candidatos, keywords, n_results):
+    """Misma fórmula que RAGSystem.search: distancia - 0.3 * coincidencias"""
+    puntuados = []
+    for doc, meta, dist in zip(candidatos['documents'][0], candidatos['metadatas'][0], candidatos['distances'][0]):
+        count = contar_coincidencias(keywords, normalizar_texto(doc))
+        puntuados.append((dist - 0.3 * count, meta['source']))
+    puntuados.sort(key=lambda x: x[0])
+    return [source for _, source in puntuados[:n_results]]
+
+
+def evaluar(nombre, extraer, candidatos_por_query, k):
+    """Mide latencia de extracción y calidad del reordenamiento"""
+    latencias = []
+    hits = 0
+    rr = []
+
+    for (query, esperado), candidatos in zip(CONSULTAS, candidatos_por_query):
+        inicio = time.perf_counter()
+        keywords = extraer(query)
+        latencias.append((time.perf_counter() - inicio) * 1000)
+
+        fuentes = reordenar(candidatos, keywords, k)
+        rango = next((i + 1 for i, s in enumerate(fuentes) if s.startswith(esperado)), None)
+        if rango:
+            hits += 1
+            rr.append(1 / rango)
+        else:
+            rr.append(0.0)
+        print(f"   [{nombre}] {query[:50]:<50} → {keywords} {'✅' if rango else '❌'}")
+
+    latencias.sort()
+    p95 = latencias[min(len(latencias) - 1, int(len(latencias) * 0.95))]
+    return {
+        "modo": nombre,
+        "hit@k": hits / len(CONSULTAS),
+        "mrr": statistics.mean(rr),
+        "p50_ms": statistics.median(latencias),
+        "p95_ms": p95,
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark de extracción de keywords")
+    parser.add_argument("--k", type=int, default=5, help="Resultados finales por consulta")
+    args = parser.parse_args()
+
+    print("=" * 70)
+    print("BENCHMARK DE KEYWORDS: LOCAL vs LLM")
+    print("=" * 70)
+
+    client = chromadb.PersistentClient(path="./chroma_db")
+    collection = client.get_collection("documentos_curso")
+    print(f"\n✓ Colección: {collection.count()} fragmentos")
+
+    try:
+        extractor = KeywordExtractor.load(IDF_FILE)
+        print(f"✓ IDF cargado desde {IDF_FILE}")
+    except Exception:
+        extractor = KeywordExtractor.from_documents(collection.get(include=["documents"])["documents"])
+        print("✓ IDF calculado desde la colección")
+
+    # Los candidatos vectoriales son los mismos para ambos modos (embeddings del backend del índice)
+    embedder = CachedEmbedder(get_backend(backend_de_coleccion(collection)))
+    print(f"✓ Embeddings: {embedder.name}")
+    candidatos_por_query = [
+        collection.query(query_embeddings=[embedder.embed_query(query)], n_results=args.k * 5)
+        for query, _ in CONSULTAS
+    ]
+
+    resultados = [evaluar("local", extractor.extract, candidatos_por_query, args.k)]
+
+    if os.getenv("GROQ_API_KEY"):
+        from groq import Groq
+        groq_client = Groq(api_key=os.getenv("GROQ_API_KEY"))
+        resultados.append(evaluar("llm", lambda q: extraer_llm(groq_client, q), candidatos_por_query, args.k))
+    else:
+        print("\n⚠️ GROQ_API_KEY no configurada: se omite el modo LLM")
+
+    print("\n" + "=" * 70)
+    print(f"{'Modo':<8}{'hit@' + str(args.k):>10}{'MRR':>10}{'p50 (ms)':>12}{'p95 (ms)':>12}")
+    for r in resultados:
+        print(f"{r['modo']:<8}{r['hit@k']:>10.2f}{r['mrr']:>10.3f}{r['p50_ms']:>12.3f}{r['p95_ms']:>12.3f}")
+    print("=" * 70)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,215 @@
+"""
+Índice invertido BM25 sobre los mismos chunks/ids de la colección de ChromaDB.
+Se construye en preprocess_embeddings.py, se guarda en chroma_db/bm25/ y se
+abre con memory-map al arrancar la app (no se copia a memoria).
+"""
+
+import json
+import time
+from pathlib import Path
+
+import numpy as np
+
+from caches import TTLLRUCache
+from keywords import tokenizar, normalizar_texto, contar_coincidencias, STOPWORDS
+
+BM25_DIR = "./chroma_db/bm25"
+
+# Textos normalizados que se guardan para confirmar frases sin volver a normalizar
+TEXTOS_NORMALIZADOS = 20000
+
+
+class BM25Index:
+    """Índice BM25 en formato CSR: postings de cada término contiguos en disco"""
+
+    def __init__(self, vocab, ids, offsets, postings, tfs, doc_len, k1=1.5, b=0.75):
+        self.vocab = vocab          # término -> id de término
+        self.ids = ids              # posición -> id del chunk en ChromaDB
+        self.offsets = offsets      # int64[V+1], inicio de los postings de cada término
+        self.postings = postings    # int32[P], posición del chunk
+        self.tfs = tfs              # float32[P], frecuencia del término en el chunk
+        self.doc_len = doc_len      # float32[N], longitud de cada chunk en tokens
+        self.k1 = k1
+        self.b = b
+        self.n_docs = len(ids)
+        self.avgdl = float(doc_len.mean()) if len(doc_len) else 0.0
+        self._posiciones = None
+        self._normalizados = TTLLRUCache(maxsize=TEXTOS_NORMALIZADOS, ttl=0)   # id -> normalizar_texto
+
+    @classmethod
+    def build(cls, documents, ids, k1=1.5, b=0.75):
+        """Construye el índice a partir de los textos y sus ids"""
+        builder = BM25Builder()
+        for doc_id, doc in zip(ids, documents):
+            builder.add(doc_id, doc)
+        return builder.build(k1, b)
+
+    def save(self, folder=BM25_DIR):
+        """Guarda el índice: arrays .npy (mapeables) + vocabulario e ids en JSON"""
+        folder = Path(folder)
+        folder.mkdir(parents=True, exist_ok=True)
+        np.save(folder / "offsets.npy", self.offsets)
+        np.save(folder / "postings.npy", self.postings)
+        np.save(folder / "tfs.npy", self.tfs)
+        np.save(folder / "doc_len.npy", self.doc_len)
+        with open(folder / "vocab.json", "w", encoding="utf-8") as f:
+            json.dump(self.vocab, f, ensure_ascii=False)
+        with open(folder / "ids.json", "w", encoding="utf-8") as f:
+            json.dump(self.ids, f, ensure_ascii=False)
+        with open(folder / "meta.json", "w", encoding="utf-8") as f:
+            json.dump({
+                "k1": self.k1,
+                "b": self.b,
+                "n_docs": self.n_docs,
+                "n_terms": len(self.vocab),
+                "built_at": time.strftime("%Y-%m-%d %H:%M:%S"),
+            }, f)
+
+    @classmethod
+    def load(cls, folder=BM25_DIR):
+        """Abre el índice guardado; los arrays quedan mapeados en memoria"""
+        folder = Path(folder)
+        with open(folder / "meta.json", "r", encoding="utf-8") as f:
+            meta = json.load(f)
+        with open(folder / "vocab.json", "r", encoding="utf-8") as f:
+            vocab = json.load(f)
+        with open(folder / "ids.json", "r", encoding="utf-8") as f:
+            ids = json.load(f)
+        return cls(
+            vocab,
+            ids,
+            np.load(folder / "offsets.npy", mmap_mode="r"),
+            np.load(folder / "postings.npy", mmap_mode="r"),
+            np.load(folder / "tfs.npy", mmap_mode="r"),
+            np.load(folder / "doc_len.npy", mmap_mode="r"),
+            meta["k1"],
+            meta["b"],
+        )
+
+    def query_terms(self, text):
+        """Tokens de la consulta presentes en el vocabulario (sin stopwords ni repetidos)"""
+        return [t for t in dict.fromkeys(tokenizar(text)) if t not in STOPWORDS and t in self.vocab]
+
+    def search(self, text, top_k=10):
+        """Devuelve [(id, score)] de los top_k chunks por BM25"""
+        terms = self.query_terms(text)
+        if not terms or not self.n_docs:
+            return []
+
+        scores = np.zeros(self.n_docs, dtype=np.float32)
+        for term in terms:
+            term_id = self.vocab[term]
+            inicio, fin = self.offsets[term_id], self.offsets[term_id + 1]
+            docs = self.postings[inicio:fin]
+            tf = self.tfs[inicio:fin]
+            df = fin - inicio
+            idf = np.log(1 + (self.n_docs - df + 0.5) / (df + 0.5))
+            norm = self.k1 * (1 - self.b + self.b * self.doc_len[docs] / self.avgdl)
+            # Cada chunk aparece una sola vez por término, la suma indexada es segura
+            scores[docs] += idf * tf * (self.k1 + 1) / (tf + norm)
+
+        top_k = min(top_k, int(np.count_nonzero(scores)))
+        if top_k == 0:
+            return []
+        top = np.argpartition(-scores, top_k - 1)[:top_k]
+        top = top[np.argsort(-scores[top])]
+        return [(self.ids[i], float(scores[i])) for i in top]
+
+
+    def posiciones(self, ids):
+        """Posición de cada id en el índice (-1 si no está)"""
+        if self._posiciones is None:
+            self._posiciones = {doc_id: pos for pos, doc_id in enumerate(self.ids)}
+        return np.fromiter((self._posiciones.get(doc_id, -1) for doc_id in ids), dtype=np.int64, count=len(ids))
+
+    def documentos_con(self, term):
+        """bool[N]: chunks que contienen el término (sus postings como bitmap)"""
+        mask = np.zeros(self.n_docs, dtype=bool)
+        term_id = self.vocab.get(term)
+        if term_id is not None:
+            mask[self.postings[self.offsets[term_id]:self.offsets[term_id + 1]]] = True
+        return mask
+
+    def _normalizado(self, doc_id, texto):
+        normalizado = self._normalizados.get(doc_id)
+        if normalizado is None:
+            normalizado = normalizar_texto(texto)
+            self._normalizados.set(doc_id, normalizado)
+        return normalizado
+
+    def coincidencias(self, keywords, ids, textos):
+        """Cuántas keywords aparecen como palabra/frase completa en cada candidato (int32[n]).
+
+        Igual que contar_coincidencias, pero con los postings en vez de recorrer los
+        textos: las frases solo se confirman en el texto de los candidatos que tienen
+        todas sus palabras, y los ids que no están en el índice se revisan por texto.
+        """
+        pos = self.posiciones(ids)
+        fuera = pos < 0
+        conteo = np.zeros(len(ids), dtype=np.int32)
+        frases = [tokenizar(kw) for kw in keywords]
+        for tokens in frases:
+            if not tokens:
+                continue
+            presentes = ~fuera
+            for term in dict.fromkeys(tokens):
+                presentes &= self.documentos_con(term)[pos]
+            if len(tokens) > 1:
+                frase = f" {' '.join(tokens)} "
+                for i in np.flatnonzero(presentes):
+                    presentes[i] = frase in self._normalizado(ids[i], textos[i])
+            conteo += presentes
+        if fuera.any():
+            normalizadas = [" ".join(tokens) for tokens in frases if tokens]
+            for i in np.flatnonzero(fuera):
+                conteo[i] = contar_coincidencias(normalizadas, self._normalizado(ids[i], textos[i]))
+        return conteo
+
+
+class BM25Builder:
+    """Construye el índice de forma incremental, un chunk a la vez (sin guardar los textos)"""
+
+    def __init__(self):
+        self.vocab = {}
+        self.por_termino = []
+        self.doc_len = []
+        self.ids = []
+
+    def add(self, doc_id, text):
+        pos = len(self.ids)
+        self.ids.append(doc_id)
+        tokens = tokenizar(text)
+        self.doc_len.append(len(tokens))
+        conteo = {}
+        for token in tokens:
+            conteo[token] = conteo.get(token, 0) + 1
+        for token, tf in conteo.items():
+            term_id = self.vocab.get(token)
+            if term_id is None:
+                term_id = self.vocab[token] = len(self.vocab)
+                self.por_termino.append([])
+            self.por_termino[term_id].append((pos, tf))
+
+    def build(self, k1=1.5, b=0.75):
+        offsets = np.zeros(len(self.vocab) + 1, dtype=np.int64)
+        for term_id, lista in enumerate(self.por_termino):
+            offsets[term_id + 1] = offsets[term_id] + len(lista)
+
+        postings = np.empty(offsets[-1], dtype=np.int32)
+        tfs = np.empty(offsets[-1], dtype=np.float32)
+        for term_id, lista in enumerate(self.por_termino):
+            inicio = offsets[term_id]
+            postings[inicio:inicio + len(lista)] = [p for p, _ in lista]
+            tfs[inicio:inicio + len(lista)] = [tf for _, tf in lista]
+
+        doc_len = np.array(self.doc_len, dtype=np.float32)
+        return BM25Index(self.vocab, self.ids, offsets, postings, tfs, doc_len, k1, b)
+
+
+def reciprocal_rank_fusion(*rankings, k=60):
+    """Fusiona listas de ids ordenadas: score = suma de 1 / (k + rango)"""
+    scores = {}
+    for ranking in rankings:
+        for rank, doc_id in enumerate(ranking, 1):
+            scores[doc_id] = scores.get(doc_id, 0.0) + 1.0 / (k + rank)
+    return sorted(scores.items(), key=lambda x: -x[1])
@@ -0,0 +1,151 @@
+"""
+Cachés en memoria compartidas por todas las sesiones de Streamlit.
+Se crean con st.cache_resource, por eso todas usan un lock.
+"""
+
+import threading
+import time
+from collections import OrderedDict
+
+import numpy as np
+
+from keywords import normalizar
+
+
+def normalizar_pregunta(texto):
+    """Clave exacta: sin acentos, minúsculas y espacios colapsados"""
+    return " ".join(normalizar(texto).split()).strip(" ¿?¡!.")
+
+
+class TTLLRUCache:
+    """Caché LRU con expiración por tiempo y contadores de aciertos"""
+
+    def __init__(self, maxsize=256, ttl=3600):
+        self.maxsize = maxsize
+        self.ttl = ttl
+        self.hits = 0
+        self.misses = 0
+        self._data = OrderedDict()
+        self._lock = threading.Lock()
+
+    def get(self, key, default=None):
+        with self._lock:
+            item = self._data.get(key)
+            if item is None or (self.ttl and time.time() - item[0] > self.ttl):
+                if item is not None:
+                    del self._data[key]
+                self.misses += 1
+                return default
+            self._data.move_to_end(key)
+            self.hits += 1
+            return item[1]
+
+    def set(self, key, value):
+        with self._lock:
+            self._data[key] = (time.time(), value)
+            self._data.move_to_end(key)
+            while len(self._data) > self.maxsize:
+                self._data.popitem(last=False)
+
+    def items(self):
+        """Copia de las entradas vigentes [(key, value)]"""
+        with self._lock:
+            now = time.time()
+            return [(k, v) for k, (t, v) in self._data.items() if not self.ttl or now - t <= self.ttl]
+
+    def clear(self):
+        with self._lock:
+            self._data.clear()
+
+    def __len__(self):
+        return len(self._data)
+
+    def stats(self):
+        total = self.hits + self.misses
+        return {
+            "entries": len(self._data),
+            "hits": self.hits,
+            "misses": self.misses,
+            "hit_rate": self.hits / total if total else 0.0,
+        }
+
+
+class AnswerCache:
+    """Caché de respuestas: coincidencia exacta o casi-duplicada por similitud coseno del embedding"""
+
+    def __init__(self, maxsize=256, ttl=24 * 3600, threshold=0.95):
+        self.threshold = threshold
+        self.version = None
+        self.hits = 0
+        self.misses = 0
+        self._entries = TTLLRUCache(maxsize, ttl)
+        self._lock = threading.Lock()
+
+    def _check_version(self, version):
+        # Si cambiaron los documentos, las respuestas guardadas ya no valen
+        with self._lock:
+            if version != self.version:
+                self._entries.clear()
+                self.version = version
+
+    def _find(self, query, embedding):
+        entry = self._entries.get(normalizar_pregunta(query))
+        if entry is not None or embedding is None:
+            return entry
+        if callable(embedding):
+            # Embedding perezoso: solo se calcula si no hubo coincidencia exacta
+            embedding = embedding()
+            if embedding is None:
+                return None
+
+        # Casi-duplicados: comparar contra los embeddings guardados
+        candidates = [(k, e) for k, e in self._entries.items() if e["embedding"] is not None]
+        if not candidates:
+            return None
+
+        matrix = np.array([e["embedding"] for _, e in candidates], dtype=np.float32)
+        query_vec = np.asarray(embedding, dtype=np.float32)
+        sims = matrix @ query_vec / (np.linalg.norm(matrix, axis=1) * np.linalg.norm(query_vec) + 1e-9)
+        best = int(np.argmax(sims))
+        if sims[best] >= self.threshold:
+            # Refrescar la posición LRU de la entrada encontrada
+            return self._entries.get(candidates[best][0])
+        return None
+
+    def lookup(self, query, embedding=None, version=None):
+        """Devuelve la entrada guardada ({'answer', 'metadatas', ...}) o None.
+        embedding: vector de la pregunta o función que lo calcula (se llama solo si hace falta)"""
+        self._check_version(version)
+        entry = self._find(query, embedding)
+        with self._lock:
+            if entry is None:
+                self.misses += 1
+            else:
+                self.hits += 1
+        return entry
+
+    def store(self, query, answer, metadatas=None, embedding=None, version=None):
+        """Guarda la respuesta generada para la pregunta"""
+        self._check_version(version)
+        self._entries.set(normalizar_pregunta(query), {
+            "answer": answer,
+            "metadatas": metadatas or [],
+            "embedding": [float(x) for x in embedding] if embedding is not None else None,
+        })
+
+    def stats(self):
+        total = self.hits + self.misses
+        return {
+            "entries": len(self._entries),
+            "hits": self.hits,
+            "misses": self.misses,
+            "hit_rate": self.hits / total if total else 0.0,
+        }
+
+
+def replay_stream(text, piece_size=12):
+    """Reproduce una respuesta guardada como stream (fragmentos de pocas palabras)"""
+    words = text.split(" ")
+    for i in range(0, len(words), piece_size):
+        piece = " ".join(words[i:i + piece_size])
+        yield piece if i + piece_size >= len(words) else piece + " "
@@ -1,10 +1,58 @@
 import streamlit as st
+import arranque
 import os
 from pathlib import Path
-import chromadb
 from datetime import datetime
 import random
-from groq import Groq
+import time
+import concurrent.futures
+import numpy as np
+from rate_limit import RPM, TPM, PRIORIDAD_CHAT
+from keywords import KeywordExtractor, IDF_FILE, tokenizar
+from bm25_index import BM25Index, BM25Builder, BM25_DIR, reciprocal_rank_fusion
+from chunking import dividir_en_chunks, metadatos_paginas, describir_fuente, contar_tokens, conteo_exacto
+from context_builder import construir_contexto, CONTEXT_TOKENS
+from cross_encoder import RERANK_CANDIDATES, RERANK_TOP_K, RERANK_BUDGET_MS
+from preprocess_embeddings import (
+    iter_batches, DEFAULT_BATCH_SIZE, MANIFEST_FILE,
+    build_corpus_stats, save_corpus_stats, load_corpus_stats, corpus_stats_from_collection,
+    build_precomputed_queries, save_precomputed_queries, load_precomputed_queries
+)
+from caches import AnswerCache, TTLLRUCache, replay_stream, normalizar_pregunta
+from contenido_curso import UNIDADES, PREGUNTAS_FRECUENTES, CONSULTAS_QUIZ, prompt_unidad
+from quiz_bank import QuizBank, generar_preguntas, PREGUNTAS_POR_QUIZ
+from embeddings import CachedEmbedder, get_backend, backend_de_coleccion, normalizar_backend, BACKEND_KEY, EMBEDDING_BACKEND
+
+# chromadb y groq se importan dentro de sus funciones get_*: el precalentamiento
+# los carga en segundo plano en vez de bloquear el primer dibujo de la página
+arranque.registrar("imports", time.perf_counter() - arranque.INICIO)
+
+# Modo de extracción de palabras clave: "local" (sin red, por defecto) o "llm"
+KEYWORD_MODE = os.getenv("ECOBOT_KEYWORD_MODE", "local")
+
+# En modo "llm", segundos máximos de espera por las palabras clave (si no, se usa el extractor local)
+KEYWORD_TIMEOUT = float(os.getenv("ECOBOT_KEYWORD_TIMEOUT", "1.5"))
+
+# Tokens máximos del [CONTEXTO] que se envía a Groq por pregunta
+CONTEXT_TOKENS_BUDGET = int(os.getenv("ECOBOT_CONTEXT_TOKENS", CONTEXT_TOKENS))
+
+# Segundos de lectura por petición a Groq y, si se define, segundos sin primer
+# token tras los que se lanza un segundo intento (hedging)
+GROQ_TIMEOUT = float(os.getenv("ECOBOT_GROQ_TIMEOUT", "60"))
+GROQ_HEDGE_AFTER = float(os.getenv("ECOBOT_GROQ_HEDGE_AFTER", "0")) or None
+
+# Límites del plan de Groq (peticiones y tokens por minuto) para el planificador
+GROQ_RPM = int(os.getenv("ECOBOT_GROQ_RPM", RPM))
+GROQ_TPM = int(os.getenv("ECOBOT_GROQ_TPM", TPM))
+
+# Cross-encoder opcional (carpeta del modelo ONNX, ver cross_encoder.py): reordena los
+# primeros candidatos y permite mandar menos fragmentos a Groq
+RERANKER_MODEL = os.getenv("ECOBOT_RERANKER")
+RERANK_BUDGET = float(os.getenv("ECOBOT_RERANK_BUDGET_MS", RERANK_BUDGET_MS))
+RERANK_N_RESULTS = int(os.getenv("ECOBOT_RERANK_TOP_K", RERANK_TOP_K))
+
+# Fragmentos por pregunta del chat sin reranker
+CHAT_N_RESULTS = 10
 
 # Configurar página
 st.set_page_config(
@@ -19,30 +67,168 @@ st.set_page_config(
 @st.cache_resource
 def get_chroma_client():
     """Carga ChromaDB una sola vez y lo mantiene en caché"""
+    import chromadb
     return chromadb.PersistentClient(path="./chroma_db")
 
+def get_index_version():
+    """Marca de la última reconstrucción con preprocess_embeddings.py (fecha del manifest)"""
+    try:
+        return os.path.getmtime(MANIFEST_FILE)
+    except OSError:
+        return None
+
+@st.cache_resource(max_entries=1)
+def get_collection(name="documentos_curso", index_version=None):
+    """Resuelve la colección una sola vez por proceso y por versión del índice"""
+    client = get_chroma_client()
+    try:
+        return client.get_collection(name)
+    except Exception:
+        return client.create_collection(
+            name=name,
+            metadata={"hnsw:space": "cosine", BACKEND_KEY: normalizar_backend(EMBEDDING_BACKEND)}
+        )
+
+@st.cache_resource(max_entries=1)
+def get_corpus_stats(index_version=None):
+    """Resumen del corpus (fragmentos por documento, tamaños, fecha del índice) para el sidebar"""
+    stats = load_corpus_stats()
+    if stats is not None:
+        return stats
+    
+    # Colección indexada antes de que existiera el resumen: calcularlo una sola vez
+    try:
+        return corpus_stats_from_collection(get_collection("documentos_curso", index_version))
+    except Exception as e:
+        print(f"⚠️ No se pudo calcular el resumen del corpus: {e}")
+        return None
+
+@st.cache_resource(max_entries=1)
+def get_precomputed_queries(index_version=None):
+    """Embeddings y candidatos de las consultas fijas, calculados al indexar"""
+    return load_precomputed_queries() or {"n_candidates": 0, "queries": {}}
+
 @st.cache_resource
 def get_groq_client():
-    """Carga cliente Groq una sola vez"""
+    """Cliente Groq asíncrono compartido (un pool de conexiones para todas las sesiones)"""
     api_key = os.getenv("GROQ_API_KEY")
     if not api_key:
         st.error("❌ GROQ_API_KEY no está configurada. Configúrala en Streamlit Secrets o variables de entorno.")
         st.stop()
     
     try:
-        return Groq(api_key=api_key)
+        from groq_client import AsyncGroqClient
+        return AsyncGroqClient(
+            api_key, timeout=GROQ_TIMEOUT, hedge_after=GROQ_HEDGE_AFTER, rpm=GROQ_RPM, tpm=GROQ_TPM
+        )
     except Exception as e:
         st.error(f"❌ Error al inicializar cliente Groq: {str(e)}")
         st.warning("Verifica que tu API key sea válida.")
         st.stop()
 
+@st.cache_resource
+def get_keyword_extractor():
+    """Carga las frecuencias IDF del corpus una sola vez"""
+    if Path(IDF_FILE).exists():
+        try:
+            return KeywordExtractor.load(IDF_FILE)
+        except Exception as e:
+            print(f"⚠️ No se pudo leer {IDF_FILE}: {e}")
+    
+    # Si no se generó el archivo, calcular desde la colección indexada
+    try:
+        collection = get_collection("documentos_curso", get_index_version())
+        return KeywordExtractor.from_documents(collection.get(include=["documents"])["documents"])
+    except Exception as e:
+        print(f"⚠️ No se pudieron calcular las frecuencias IDF: {e}")
+        return KeywordExtractor()
+
+@st.cache_resource
+def get_bm25_index():
+    """Abre el índice BM25 (memory-map) una sola vez; None si no se ha construido"""
+    if not Path(BM25_DIR, "meta.json").exists():
+        print(f"⚠️ Índice BM25 no encontrado en {BM25_DIR}. Ejecuta: python preprocess_embeddings.py")
+        return None
+    try:
+        return BM25Index.load(BM25_DIR)
+    except Exception as e:
+        print(f"⚠️ No se pudo abrir el índice BM25: {e}")
+        return None
+
+@st.cache_resource(max_entries=1)
+def get_term_index(index_version=None):
+    """Término → chunks para contar keywords sin recorrer los textos: el índice BM25 o,
+    si no se construyó, uno en memoria a partir de la colección (una vez por proceso)"""
+    bm25 = get_bm25_index()
+    if bm25 is not None:
+        return bm25
+    builder = BM25Builder()
+    collection = get_collection("documentos_curso", index_version)
+    for offset in range(0, collection.count(), 1000):
+        batch = collection.get(limit=1000, offset=offset, include=["documents"])
+        for chunk_id, doc in zip(batch["ids"], batch["documents"]):
+            builder.add(chunk_id, doc)
+    return builder.build()
+
+@st.cache_resource(max_entries=1)
+def get_embedder(index_version=None):
+    """Embedder (con caché en disco) del backend con el que se indexó la colección"""
+    collection = get_collection("documentos_curso", index_version)
+    return CachedEmbedder(get_backend(backend_de_coleccion(collection)))
+
+@st.cache_resource
+def get_reranker():
+    """Cross-encoder de la segunda etapa; None si no está configurado o no carga"""
+    if not RERANKER_MODEL:
+        return None
+    try:
+        from cross_encoder import CrossEncoderReranker
+        reranker = CrossEncoderReranker(RERANKER_MODEL)
+        print(f"🎯 Reranker cargado: {reranker.name}")
+        return reranker
+    except Exception as e:
+        print(f"⚠️ No se pudo cargar el reranker {RERANKER_MODEL}: {e}")
+        return None
+
+def precalentar_sistema():
+    """Abre la colección, carga el modelo de embeddings y hace una consulta (sube el índice
+    HNSW a memoria) en un hilo de fondo, para que la primera pregunta no pague esos costos"""
+    def primera_consulta():
+        embedding = get_embedder(get_index_version()).embed_query("integración regional")
+        get_collection("documentos_curso", get_index_version()).query(query_embeddings=[embedding], n_results=1)
+    
+    arranque.precalentar([
+        ("abrir ChromaDB", lambda: get_collection("documentos_curso", get_index_version())),
+        ("cargar modelo de embeddings", lambda: get_embedder(get_index_version()).embed_query("calentamiento")),
+        ("primera consulta", primera_consulta),
+        ("importar cliente Groq", lambda: __import__("groq_client")),
+        ("cargar tokenizador", lambda: contar_tokens("calentamiento")),
+    ] + ([
+        ("cargar reranker", lambda: get_reranker() and get_reranker().puntuar("calentamiento", ["calentamiento"])),
+    ] if RERANKER_MODEL else []))
+
+@st.cache_resource
+def get_answer_cache():
+    """Caché de respuestas compartida por todas las sesiones"""
+    return AnswerCache()
+
+@st.cache_resource
+def get_retrieval_cache():
+    """Resultados ya reordenados de search(), compartidos por todas las sesiones.
+    La clave lleva la versión del índice: tras reindexar las entradas viejas no se usan"""
+    return TTLLRUCache(maxsize=512, ttl=3600)
+
 # ==================== CONFIGURACIÓN RAG CON GROQ ====================
 
 class RAGSystem:
-    def __init__(self):
+    def __init__(self, keyword_mode=None):
         self.client = get_chroma_client()
         self.groq_client = get_groq_client()
+        self.keyword_extractor = get_keyword_extractor()
+        self.bm25 = get_bm25_index()
+        self.keyword_mode = keyword_mode or KEYWORD_MODE
         self.collection_name = "documentos_curso"
+        self.last_prompt_tokens = 0
     
     def get_documents_hash(self, folder_path="./documentos"):
         """Genera un hash de los documentos actuales"""
@@ -84,29 +270,14 @@ class RAGSystem:
             return True
         
     def get_or_create_collection(self):
-        """Obtiene o crea la colección de ChromaDB"""
-        try:
-            collection = self.client.get_collection(self.collection_name)
-        except:
-            collection = self.client.create_collection(
-                name=self.collection_name,
-                metadata={"hnsw:space": "cosine"}
-            )
-        return collection
-    
-    def chunk_text(self, text, chunk_size=1000, overlap=200):
-        """Divide el texto en chunks"""
-        chunks = []
-        start = 0
-        text_length = len(text)
-        
-        while start < text_length:
-            end = start + chunk_size
-            chunk = text[start:end]
-            chunks.append(chunk)
-            start += chunk_size - overlap
-            
-        return chunks
+        """Obtiene o crea la colección de ChromaDB (handle en caché por proceso)"""
+        return get_collection(self.collection_name, get_index_version())
+    
+    def refresh_collection(self):
+        """Descarta el handle en caché y vuelve a resolver la colección"""
+        get_collection.clear()
+        get_embedder.clear()
+        return self.get_or_create_collection()
     
     def load_txt(self, txt_path):
         """Carga texto de un archivo TXT"""
@@ -117,8 +288,29 @@ class RAGSystem:
             st.error(f"Error al leer TXT {txt_path}: {e}")
             return None
     
-    def process_documents(self, folder_path="./documentos"):
-        """Procesa todos los documentos de la carpeta"""
+    def iter_chunks(self, files, sources=None):
+        """Genera (índice de archivo, id, texto, metadatos) leyendo un archivo a la vez
+        Si se pasa sources, anota {archivo: {"chunks", "chars"}} para el resumen del corpus"""
+        for idx, file_path in enumerate(files):
+            if file_path.suffix.lower() != '.txt':
+                continue
+            
+            content = self.load_txt(file_path)
+            if content:
+                chunks = dividir_en_chunks(content)
+                if sources is not None:
+                    sources[file_path.name] = {"chunks": len(chunks), "chars": len(content)}
+                
+                for chunk_idx, chunk in enumerate(chunks):
+                    yield idx, f"{file_path.stem}_{chunk_idx}", chunk["text"], {
+                        "source": file_path.name,
+                        "chunk": chunk_idx,
+                        "total_chunks": len(chunks),
+                        **metadatos_paginas(chunk)
+                    }
+    
+    def process_documents(self, folder_path="./documentos", batch_size=DEFAULT_BATCH_SIZE):
+        """Procesa todos los documentos de la carpeta en lotes de batch_size fragmentos"""
         collection = self.get_or_create_collection()
         
         folder = Path(folder_path)
@@ -126,10 +318,6 @@ class RAGSystem:
             st.warning(f"La carpeta {folder_path} no existe")
             return 0
         
-        documents = []
-        metadatas = []
-        ids = []
-        
         files = list(folder.glob("*.txt"))
         
         if not files:
@@ -139,54 +327,67 @@ class RAGSystem:
         progress_bar = st.progress(0)
         status_text = st.empty()
         
-        for idx, file_path in enumerate(files):
-            status_text.text(f"Procesando: {file_path.name}...")
-            
-            if file_path.suffix.lower() == '.txt':
-                content = self.load_txt(file_path)
-            else:
-                continue
-            
-            if content:
-                chunks = self.chunk_text(content)
-                
-                for chunk_idx, chunk in enumerate(chunks):
-                    documents.append(chunk)
-                    metadatas.append({
-                        "source": file_path.name,
-                        "chunk": chunk_idx,
-                        "total_chunks": len(chunks)
-                    })
-                    ids.append(f"{file_path.stem}_{chunk_idx}")
-            
-            progress_bar.progress((idx + 1) / len(files))
+        bm25_builder = BM25Builder()
+        total = 0
+        sources = {}
+        inicio = time.perf_counter()
         
-        # Agregar a ChromaDB (ChromaDB genera embeddings internamente)
-        if documents:
-            status_text.text("Creando embeddings y guardando en la base de datos...")
-            
-            try:
+        # Agregar a ChromaDB por lotes (los textos ya vistos por el backend salen de la caché)
+        try:
+            embedder = get_embedder(get_index_version())
+            for batch in iter_batches(self.iter_chunks(files, sources), batch_size):
+                file_idx = batch[-1][0]
+                status_text.text(f"Creando embeddings: {files[file_idx].name}... ({total} fragmentos guardados)")
+                
+                documents = [item[2] for item in batch]
                 collection.add(
+                    ids=[item[1] for item in batch],
                     documents=documents,
-                    metadatas=metadatas,
-                    ids=ids
+                    embeddings=embedder.embed(documents),
+                    metadatas=[item[3] for item in batch]
                 )
-                status_text.text(f"✓ Procesados {len(documents)} fragmentos de {len(files)} archivos")
-                progress_bar.empty()
-            except Exception as e:
-                st.error(f"Error al guardar en ChromaDB: {e}")
-                progress_bar.empty()
-                return 0
+                for _, chunk_id, chunk, _ in batch:
+                    bm25_builder.add(chunk_id, chunk)
+                total += len(batch)
+                progress_bar.progress((file_idx + 1) / len(files))
+        except Exception as e:
+            st.error(f"Error al guardar en ChromaDB: {e}")
+            progress_bar.empty()
+            return 0
         
-        return len(documents)
-    
-    def search(self, query, n_results=5):
-        """Busca documentos relevantes con prioridad a palabras clave extraídas por LLM"""
-        collection = self.get_or_create_collection()
+        if total:
+            duracion = time.perf_counter() - inicio
+            status_text.text(f"✓ Procesados {total} fragmentos de {len(files)} archivos ({total / duracion:.0f} fragmentos/s)")
+            progress_bar.empty()
+            
+            save_corpus_stats(build_corpus_stats(sources, duracion))
+            get_corpus_stats.clear()
+            
+            # Consultas fijas de los botones y del quiz contra la colección nueva
+            save_precomputed_queries(build_precomputed_queries(collection, embedder=embedder))
+            get_precomputed_queries.clear()
+            
+            # Recalcular el índice BM25 y el IDF del extractor de keywords
+            bm25 = bm25_builder.build()
+            bm25.save(BM25_DIR)
+            KeywordExtractor.from_index(bm25).save(IDF_FILE)
+            get_collection.clear()
+            get_embedder.clear()
+            get_keyword_extractor.clear()
+            get_retrieval_cache().clear()
+            get_bm25_index.clear()
+            get_term_index.clear()
+            # Las preguntas del banco eran de los documentos anteriores
+            get_quiz_bank(get_index_version()).vaciar()
+            self.keyword_extractor = get_keyword_extractor()
+            self.bm25 = get_bm25_index()
         
-        try:
-            # Extraer palabras clave usando el LLM
-            keyword_prompt = f"""Extrae SOLO las palabras clave más importantes de la siguiente pregunta. 
+        return total
+    
+    async def extract_keywords_llm(self, query):
+        """Extrae palabras clave con el LLM (modo opcional, agrega una llamada a Groq).
+        Es una corrutina: corre en el loop del cliente Groq, en paralelo con la búsqueda."""
+        keyword_prompt = f"""Extrae SOLO las palabras clave más importantes de la siguiente pregunta. 
 Ignora palabras como: qué, es, el, la, de, en, etc.
 Enfócate en: nombres propios, términos técnicos, conceptos importantes.
 
@@ -195,56 +396,200 @@ Pregunta: {query}
 Responde SOLO con las palabras clave separadas por comas, sin explicación adicional.
 Ejemplo: "tratado, maastricht" o "brexit, consecuencias" o "mercosur"
 """
-            
+        
+        keyword_response = await self.groq_client.acomplete(
+            model="llama-3.1-8b-instant",
+            messages=[{"role": "user", "content": keyword_prompt}],
+            temperature=0.0,
+            max_tokens=50
+        )
+        
+        keywords_text = keyword_response.choices[0].message.content.strip()
+        # Limpiar y convertir a lista (normalizada igual que el extractor local)
+        keywords = [" ".join(tokenizar(kw)) for kw in keywords_text.split(',')]
+        return [kw for kw in keywords if kw]
+    
+    def start_keyword_extraction(self, query):
+        """Lanza la extracción con LLM en segundo plano; None en modo local"""
+        if self.keyword_mode != "llm":
+            return None
+        return self.groq_client.submit(self.extract_keywords_llm(query))
+    
+    def extract_keywords(self, query, pending=None, deadline=None):
+        """Extrae palabras clave de la pregunta según el modo configurado
+        
+        pending/deadline: extracción con LLM ya lanzada y hasta cuándo esperarla
+        Devuelve (keywords, degradada): degradada si el LLM no respondió y se usó el extractor local
+        """
+        if self.keyword_mode == "llm":
+            if pending is None:
+                pending = self.start_keyword_extraction(query)
+                deadline = time.monotonic() + KEYWORD_TIMEOUT
             try:
-                keyword_response = self.groq_client.chat.completions.create(
-                    model="llama-3.1-8b-instant",
-                    messages=[{"role": "user", "content": keyword_prompt}],
-                    temperature=0.0,
-                    max_tokens=50
-                )
-                
-                keywords_text = keyword_response.choices[0].message.content.strip()
-                # Limpiar y convertir a lista
-                keywords = [kw.strip().lower() for kw in keywords_text.split(',') if kw.strip()]
+                return pending.result(timeout=max(0.0, deadline - time.monotonic())), False
+            except concurrent.futures.TimeoutError:
+                pending.cancel()
+                print(f"⚠️ Advertencia: Las keywords con LLM tardaron más de {KEYWORD_TIMEOUT}s. Usando extracción local.")
             except Exception as keyword_error:
-                # Fallback: extracción simple si falla el LLM
-                print(f"⚠️ Advertencia: No se pudo extraer keywords con LLM ({str(keyword_error)}). Usando extracción simple.")
-                stopwords = {'el', 'la', 'de', 'en', 'y', 'a', 'los', 'las', 'qué', 'es', 'un', 'una'}
-                keywords = [w.lower() for w in query.split() if w.lower() not in stopwords and len(w) > 2]
+                # Fallback: extractor local si falla el LLM
+                print(f"⚠️ Advertencia: No se pudo extraer keywords con LLM ({str(keyword_error)}). Usando extracción local.")
+            return self.keyword_extractor.extract(query), True
+        
+        return self.keyword_extractor.extract(query), False
+    
+    def rerank_by_keywords(self, initial_results, keywords, n_results):
+        """Reordena los candidatos vectoriales con bonus por keywords encontradas"""
+        ids = initial_results['ids'][0]
+        if not ids:
+            return []
+        documents = initial_results['documents'][0]
+        
+        # Coincidencias de keywords como palabras completas (sin acentos), desde los postings
+        keyword_count = get_term_index(get_index_version()).coincidencias(keywords, ids, documents)
+        
+        # Score combinado: similitud semántica (distancia) - 0.3 por cada keyword
+        distances = np.asarray(initial_results['distances'][0], dtype=np.float64)
+        final_score = distances - 0.3 * keyword_count
+        
+        # Orden estable: en los empates manda el orden de la búsqueda vectorial
+        # (con ~500 candidatos ordenar todo cuesta lo mismo que argpartition)
+        top = np.argsort(final_score, kind="stable")[:n_results]
+        return [{
+            'doc': documents[i],
+            'metadata': initial_results['metadatas'][0][i],
+            'id': ids[i],
+            'distance': initial_results['distances'][0][i],
+            'keyword_count': int(keyword_count[i]),
+            'final_score': float(final_score[i])
+        } for i in top]
+    
+    def fuse_with_bm25(self, collection, initial_results, keywords, query, n_results):
+        """Fusiona resultados vectoriales y BM25 con reciprocal rank fusion"""
+        bm25_query = " ".join(keywords) if keywords else query
+        bm25_hits = self.bm25.search(bm25_query, top_k=n_results * 5)
+        
+        vector_ids = initial_results['ids'][0]
+        fused = reciprocal_rank_fusion(vector_ids, [doc_id for doc_id, _ in bm25_hits])[:n_results]
+        
+        candidates = {}
+        for idx, doc_id in enumerate(vector_ids):
+            candidates[doc_id] = {
+                'doc': initial_results['documents'][0][idx],
+                'metadata': initial_results['metadatas'][0][idx],
+                'id': doc_id,
+                'distance': initial_results['distances'][0][idx]
+            }
+        
+        # Chunks que solo encontró BM25: traer texto y metadatos de ChromaDB
+        missing = [doc_id for doc_id, _ in fused if doc_id not in candidates]
+        if missing:
+            extra = collection.get(ids=missing)
+            for doc_id, doc, metadata in zip(extra['ids'], extra['documents'], extra['metadatas']):
+                candidates[doc_id] = {'doc': doc, 'metadata': metadata, 'id': doc_id, 'distance': None}
+        
+        top_results = []
+        for doc_id, score in fused:
+            if doc_id in candidates:
+                candidates[doc_id]['final_score'] = score
+                top_results.append(candidates[doc_id])
+        return top_results
+    
+    def precomputed_query(self, query):
+        """Embedding y candidatos guardados al indexar si query es una consulta fija; None si no"""
+        return get_precomputed_queries(get_index_version())["queries"].get(normalizar_pregunta(query))
+    
+    def precomputed_results(self, collection, precomputed, n_candidates):
+        """Candidatos vectoriales guardados, con el formato de collection.query (None si ya no sirven)"""
+        ids = precomputed["ids"][:n_candidates]
+        if len(ids) < n_candidates:
+            return None
+        try:
+            got = collection.get(ids=ids, include=["documents", "metadatas"])
+        except Exception:
+            return None
+        por_id = dict(zip(got["ids"], zip(got["documents"], got["metadatas"])))
+        if len(por_id) < len(ids):
+            # Algún fragmento se borró después de precalcular: mejor consultar de nuevo
+            return None
+        return {
+            'ids': [ids],
+            'documents': [[por_id[i][0] for i in ids]],
+            'metadatas': [[por_id[i][1] for i in ids]],
+            'distances': [precomputed["distances"][:n_candidates]]
+        }
+    
+    def embed_query(self, query):
+        """Calcula el embedding de la pregunta (None si falla)"""
+        precomputed = self.precomputed_query(query)
+        if precomputed is not None:
+            return precomputed["embedding"]
+        try:
+            return get_embedder(get_index_version()).embed_query(query)
+        except Exception as e:
+            print(f"⚠️ No se pudo calcular el embedding de la pregunta: {e}")
+            return None
+    
+    def search(self, query, n_results=5, query_embedding=None, n_fallback=None):
+        """Busca documentos relevantes con prioridad a palabras clave de la pregunta.
+        n_fallback: resultados de la primera etapa si el reranker no alcanza su presupuesto"""
+        n_fallback = max(n_fallback or n_results, n_results)
+        # Misma pregunta (normalizada), mismo n_results y mismo índice: resultado guardado
+        retrieval_cache = get_retrieval_cache()
+        cache_key = (normalizar_pregunta(query), n_results, get_index_version(), self.keyword_mode)
+        cached = retrieval_cache.get(cache_key)
+        if cached is not None:
+            stats = retrieval_cache.stats()
+            print(f"♻️ Búsqueda desde caché ({stats['hits']} aciertos, {stats['misses']} fallos)")
+            return {campo: [list(valores[0])] for campo, valores in cached.items()}
+        
+        collection = self.get_or_create_collection()
+        
+        try:
+            # Las keywords solo sirven para reordenar: el LLM trabaja mientras corre la consulta vectorial
+            pending = self.start_keyword_extraction(query)
+            deadline = time.monotonic() + KEYWORD_TIMEOUT
             
-            # Obtener más resultados iniciales para filtrar
-            initial_results = collection.query(
-                query_texts=[query],
-                n_results=n_results * 5  # 5x más para tener margen
-            )
+            # Consultas fijas (botones y quiz): candidatos precalculados, sin búsqueda vectorial
+            initial_results = None
+            precomputed = self.precomputed_query(query)
+            if precomputed is not None:
+                initial_results = self.precomputed_results(collection, precomputed, n_results * 5)
             
-            # Reordenar resultados priorizando keywords
-            scored_results = []
-            for idx, doc in enumerate(initial_results['documents'][0]):
-                doc_lower = doc.lower()
-                
-                # Contar coincidencias exactas de keywords
-                keyword_count = sum(1 for kw in keywords if kw in doc_lower)
-                
-                # Score combinado: similitud semántica (distancia) + bonus por keywords
-                semantic_distance = initial_results['distances'][0][idx]
-                keyword_bonus = keyword_count * 0.3  # Reducir distancia por cada keyword
-                
-                final_score = semantic_distance - keyword_bonus
-                
-                scored_results.append({
-                    'doc': doc,
-                    'metadata': initial_results['metadatas'][0][idx],
-                    'id': initial_results['ids'][0][idx],
-                    'distance': initial_results['distances'][0][idx],
-                    'keyword_count': keyword_count,
-                    'final_score': final_score
-                })
+            if initial_results is None:
+                # Obtener más resultados iniciales para filtrar, con el embedder del índice
+                # (si ya se calculó el embedding de la pregunta, no se vuelve a calcular)
+                if query_embedding is None:
+                    query_embedding = self.embed_query(query)
+                consulta = {"query_embeddings": [query_embedding]}
+                try:
+                    initial_results = collection.query(n_results=n_results * 5, **consulta)  # 5x más para tener margen
+                except Exception:
+                    # La colección se recreó desde otro proceso (preprocess_embeddings.py --full)
+                    collection = self.refresh_collection()
+                    initial_results = collection.query(n_results=n_results * 5, **consulta)
+            
+            # Búsqueda degradada (keywords locales por timeout, reranker sin tiempo): no se guarda en caché
+            keywords, degradada = self.extract_keywords(query, pending, deadline)
+            
+            # Con cross-encoder, la primera etapa deja más candidatos para la segunda
+            reranker = get_reranker()
+            n_first_stage = max(n_fallback, RERANK_CANDIDATES) if reranker is not None else n_results
             
-            # Ordenar por score final y tomar top n_results
-            scored_results.sort(key=lambda x: x['final_score'])
-            top_results = scored_results[:n_results]
+            if self.bm25 is not None:
+                # Búsqueda híbrida: fusionar ranking vectorial con BM25
+                top_results = self.fuse_with_bm25(collection, initial_results, keywords, query, n_first_stage)
+            else:
+                # Sin índice BM25: reordenar candidatos vectoriales por keywords
+                top_results = self.rerank_by_keywords(initial_results, keywords, n_first_stage)
+            
+            if reranker is not None and len(top_results) > n_results:
+                order = reranker.reordenar(query, [r['doc'] for r in top_results], n_results, RERANK_BUDGET)
+                if order is None:
+                    print(f"⏱️ Reranker fuera de presupuesto ({RERANK_BUDGET:.0f} ms), se usa el orden de la primera etapa")
+                    top_results = top_results[:n_fallback]
+                    degradada = True
+                else:
+                    top_results = [top_results[i] for i in order]
             
             # Reconstruir formato de resultados
             results = {
@@ -253,8 +598,10 @@ Ejemplo: "tratado, maastricht" o "brexit, consecuencias" o "mercosur"
                 'ids': [[r['id'] for r in top_results]],
                 'distances': [[r['distance'] for r in top_results]]
             }
+            if not degradada:
+                retrieval_cache.set(cache_key, results)
             
-            return results
+            return {campo: [list(valores[0])] for campo, valores in results.items()}
         except Exception as e:
             st.error(f"❌ Error en búsqueda de documentos: {str(e)}")
             import traceback
@@ -262,7 +609,7 @@ Ejemplo: "tratado, maastricht" o "brexit, consecuencias" o "mercosur"
             return None
     
     def generate_response(self, query, context_docs):
-        """Genera respuesta usando Groq"""
+        """Genera respuesta usando Groq (context_docs: pasajes de construir_contexto)"""
         context = "\n\n".join(context_docs)
         
         system_instruction = """Eres EcoBot, un asistente académico experto en la Integración Regional de Europa y América.
@@ -282,9 +629,11 @@ INSTRUCCIONES ESTRICTAS:
 [PREGUNTA]
 {query}
 """
+        # Tamaño del prompt enviado, para seguir el ahorro de tokens por pregunta
+        self.last_prompt_tokens = contar_tokens(system_instruction) + contar_tokens(user_content)
 
         try:
-            response = self.groq_client.chat.completions.create(
+            response = self.groq_client.stream(
                 model="llama-3.1-8b-instant",
                 messages=[
                     {
@@ -297,8 +646,7 @@ INSTRUCCIONES ESTRICTAS:
                     }
                 ],
                 temperature=0.0,
-                max_tokens=1500,
-                stream=True
+                max_tokens=1500
             )
             
             return response
@@ -360,182 +708,55 @@ def get_consejo_estudio():
     ]
     return random.choice(consejos)
 
-def generar_preguntas_quiz(rag_system):
-    """Genera preguntas de quiz dinámicamente usando Groq"""
-    import json
-    import random
-    
-    # Usar diferentes queries aleatorias para obtener contextos variados
-    queries_posibles = [
-        "integración regional Europa instituciones Unión Europea",
-        "América Latina Mercosur TLCAN integración económica",
-        "tratados europeos Maastricht Roma Lisboa",
-        "teorías integración regional supranacional intergubernamental",
-        "Brexit consecuencias política europea comercio",
-        "zonas libre comercio uniones aduaneras mercado común"
-    ]
-    
-    query_seleccionada = random.choice(queries_posibles)
-    
-    # Buscar fragmentos relevantes con query aleatoria
-    try:
-        resultados = rag_system.search(query_seleccionada, n_results=5)
-        
-        if not resultados or 'documents' not in resultados or not resultados['documents']:
-            st.error("❌ **Error al buscar documentos:** No se encontraron documentos en la base de datos")
-            st.warning("⚠️ Verifica que la base de datos ChromaDB tenga documentos cargados.")
-            st.info("💡 **Solución:** Asegúrate de que los documentos estén procesados correctamente.")
-            return None
-        
-        contexto = ""
-        for doc in resultados['documents'][0]:
-            contexto += doc + "\n\n"
-        
-        if not contexto.strip():
-            st.error("❌ **Error:** El contexto recuperado está vacío")
-            st.warning("⚠️ La base de datos no contiene información suficiente.")
-            return None
-            
-    except Exception as e:
-        st.error(f"❌ **Error al buscar documentos:** {str(e)}")
-        st.warning("⚠️ Verifica que la base de datos ChromaDB tenga documentos cargados.")
-        st.info("💡 **Solución:** Asegúrate de que los documentos estén procesados correctamente.")
-        return None
-    
-    # Generar semilla aleatoria para mayor variabilidad
-    seed_variacion = random.randint(1, 1000)
-    
-    # Prompt para generar preguntas con instrucción de variabilidad
-    prompt = f"""Basándote en el siguiente contexto sobre Integración Regional en Europa y América, genera exactamente 5 preguntas de opción múltiple ÚNICAS Y DIFERENTES en formato JSON.
-
-IMPORTANTE: Genera preguntas VARIADAS y ORIGINALES. No repitas preguntas comunes. Usa este número como inspiración para variar: {seed_variacion}
+@st.cache_resource(max_entries=1)
+def get_quiz_bank(index_version=None):
+    """Banco de preguntas del quiz compartido por todas las sesiones, por versión del índice"""
+    return QuizBank.load(version=index_version)
 
-CONTEXTO:
-{contexto}
+def reponer_banco_quiz(rag_system, vistas=()):
+    """Repone en segundo plano los temas del banco con pocas preguntas sin ver"""
+    collection = rag_system.get_or_create_collection()
+    get_quiz_bank(get_index_version()).rellenar_en_fondo(
+        lambda tema: generar_preguntas(rag_system.groq_client, collection, tema), vistas
+    )
 
-Genera el JSON exactamente en este formato (sin markdown):
-{{
-    "preguntas": [
-        {{
-            "pregunta": "¿Pregunta sobre el tema?",
-            "opciones": ["A) Opción 1", "B) Opción 2", "C) Opción 3", "D) Opción 4"],
-            "respuesta_correcta": 0,
-            "explicacion": "Breve explicación de por qué es correcta"
-        }}
-    ]
-}}
-
-Asegúrate de:
-1. La respuesta correcta siempre es una de las opciones
-2. respuesta_correcta es el índice (0, 1, 2 o 3)
-3. Preguntas VARIADAS, CREATIVAS y educativas
-4. Explicaciones claras y útiles
-5. NO repetir las mismas preguntas típicas"""
-
-    # Llamar a Groq para generar preguntas con mayor temperatura
-    try:
-        response = rag_system.groq_client.chat.completions.create(
-            model="llama-3.1-8b-instant",
-            messages=[
-                {"role": "user", "content": prompt}
-            ],
-            temperature=1.0,
-            max_tokens=1000
-        )
-        
-        if not response or not response.choices:
-            st.error("❌ **Error:** La API de Groq no devolvió ninguna respuesta")
-            st.warning("⚠️ El servicio no respondió correctamente.")
-            st.info("💡 **Solución:** Espera unos segundos y vuelve a intentar.")
-            return None
-            
-    except Exception as e:
-        st.error(f"❌ **Error al comunicarse con Groq API:** {str(e)}")
-        st.warning("⚠️ **Posibles causas:**")
-        st.markdown("""
-        - 🔑 API key inválida o expirada
-        - ⏱️ Límite de tasa excedido (rate limit)
-        - 🌐 Problemas de conexión a internet
-        - 🛠️ Servicio de Groq temporalmente no disponible
-        """)
-        st.info("💡 **Solución:** Espera unos segundos y vuelve a intentar. Si persiste, verifica tu API key en Streamlit Secrets.")
-        return None
+def generar_preguntas_quiz(rag_system):
+    """Saca 5 preguntas del banco que la sesión no haya visto (generadas en segundo plano)"""
+    bank = get_quiz_bank(get_index_version())
+    vistas = st.session_state.setdefault('quiz_vistas', set())
+    preguntas = bank.sacar(PREGUNTAS_POR_QUIZ, vistas)
     
-    # Extraer respuesta
-    try:
-        respuesta_text = response.choices[0].message.content
-        
-        if not respuesta_text:
-            st.error("❌ **Error:** La respuesta de Groq está vacía")
-            st.warning("⚠️ No se recibió contenido de la API.")
-            return None
-        
-        # Limpiar respuesta si tiene markdown o texto adicional
-        respuesta_text = respuesta_text.replace("```json", "").replace("```", "").strip()
-        
-        # Buscar el JSON en la respuesta (puede tener texto antes o después)
-        import re
-        # Buscar el patrón de JSON que empieza con { y termina con }
-        json_match = re.search(r'\{[\s\S]*\}', respuesta_text)
-        
-        if json_match:
-            respuesta_text = json_match.group(0)
-        else:
-            st.error("❌ **Error:** No se encontró JSON válido en la respuesta")
-            st.warning("⚠️ La respuesta no contiene un objeto JSON reconocible")
-            with st.expander("🔍 Ver respuesta recibida"):
-                st.code(respuesta_text, language="text")
-            return None
-        
-        # Parsear JSON
-        data = json.loads(respuesta_text)
-        
-        if 'preguntas' not in data:
-            st.error("❌ **Error de formato:** El JSON no contiene el campo 'preguntas'")
-            st.warning("⚠️ La respuesta de Groq no tiene el formato esperado")
-            with st.expander("🔍 Ver respuesta recibida"):
-                st.code(respuesta_text, language="json")
+    if len(preguntas) < PREGUNTAS_POR_QUIZ:
+        # Banco vacío (sin `python quiz_bank.py` y antes de que el hilo de fondo reponga): generar ahora
+        tema = random.choice(CONSULTAS_QUIZ)
+        aviso = st.empty()
+        try:
+            bank.agregar(tema, generar_preguntas(
+                rag_system.groq_client, rag_system.get_or_create_collection(), tema, prioridad=PRIORIDAD_CHAT,
+                on_pregunta=lambda n: aviso.caption(f"✍️ {n} de {PREGUNTAS_POR_QUIZ} preguntas listas...")
+            ))
+        except Exception as e:
+            st.error(f"❌ **Error al generar preguntas:** {str(e)}")
+            st.warning("⚠️ **Posibles causas:**")
+            st.markdown("""
+            - 🔑 API key inválida o expirada
+            - ⏱️ Límite de tasa excedido (rate limit)
+            - 🌐 Problemas de conexión a internet
+            - 🛠️ Servicio de Groq temporalmente no disponible
+            """)
+            st.info("💡 **Solución:** Espera unos segundos y vuelve a intentar. Si persiste, verifica tu API key en Streamlit Secrets.")
             return None
-        
-        if not isinstance(data['preguntas'], list) or len(data['preguntas']) == 0:
-            st.error("❌ **Error:** El campo 'preguntas' está vacío o no es una lista")
-            st.warning("⚠️ No se generaron preguntas válidas")
+        finally:
+            aviso.empty()
+        preguntas = bank.sacar(PREGUNTAS_POR_QUIZ, vistas)
+        if not preguntas:
+            st.error("❌ **Error:** No se generaron preguntas válidas")
+            st.info("💡 **Solución:** Intenta generar el quiz nuevamente.")
             return None
-        
-        # Validar estructura de cada pregunta
-        for i, pregunta in enumerate(data['preguntas']):
-            campos_requeridos = ['pregunta', 'opciones', 'respuesta_correcta', 'explicacion']
-            for campo in campos_requeridos:
-                if campo not in pregunta:
-                    st.error(f"❌ **Error de validación:** La pregunta {i+1} no tiene el campo '{campo}'")
-                    st.warning("⚠️ Las preguntas generadas no tienen la estructura completa")
-                    return None
-            
-            if not isinstance(pregunta['opciones'], list) or len(pregunta['opciones']) != 4:
-                st.error(f"❌ **Error de validación:** La pregunta {i+1} debe tener exactamente 4 opciones")
-                st.warning("⚠️ Estructura de opciones incorrecta")
-                return None
-            
-            if not isinstance(pregunta['respuesta_correcta'], int) or pregunta['respuesta_correcta'] not in [0, 1, 2, 3]:
-                st.error(f"❌ **Error de validación:** La pregunta {i+1} tiene un índice de respuesta inválido")
-                st.warning("⚠️ El índice de respuesta correcta debe ser 0, 1, 2 o 3")
-                return None
-        
-        st.success(f"✅ Se generaron {len(data['preguntas'])} preguntas exitosamente")
-        return data['preguntas']
-        
-    except json.JSONDecodeError as e:
-        st.error(f"❌ **Error al parsear JSON:** {str(e)}")
-        st.warning("⚠️ La respuesta de Groq no está en formato JSON válido")
-        with st.expander("🔍 Ver respuesta recibida"):
-            st.code(respuesta_text, language="text")
-        st.info("💡 **Solución:** Intenta generar el quiz nuevamente. Si persiste, puede ser un problema temporal de la API.")
-        return None
-    except Exception as e:
-        st.error(f"❌ **Error inesperado al procesar la respuesta:** {str(e)}")
-        st.warning("⚠️ Ocurrió un error al validar las preguntas generadas")
-        st.info("💡 **Solución:** Intenta nuevamente. Si el problema persiste, contacta al soporte.")
-        return None
+    
+    vistas.update(p["id"] for p in preguntas)
+    reponer_banco_quiz(rag_system, vistas)
+    return preguntas
 
 def mostrar_bienvenida():
     """Muestra mensaje de bienvenida"""
@@ -555,9 +776,117 @@ def mostrar_bienvenida():
     3. O escribe tu propia pregunta en el campo de texto
     """)
 
+def mostrar_respuesta(prompt):
+    """Busca contexto, muestra la respuesta en streaming y la agrega al historial"""
+    rag = st.session_state.rag
+    answer_cache = get_answer_cache()
+    
+    with st.chat_message("assistant"):
+        with st.spinner("Buscando información..."):
+            try:
+                inicio = time.perf_counter()
+                
+                # La caché se invalida sola cuando cambian los documentos
+                version = rag.get_documents_hash()
+                # El embedding solo se calcula si no hay coincidencia exacta (p. ej. los botones)
+                embeddings = {}
+                def embedding_pregunta():
+                    embeddings['query'] = rag.embed_query(prompt)
+                    return embeddings['query']
+                cached = answer_cache.lookup(prompt, embedding_pregunta, version)
+                query_embedding = embeddings.get('query')
+                
+                if cached:
+                    response = replay_stream(cached['answer'])
+                    metadatas = cached['metadatas']
+                else:
+                    # Con el cross-encoder alcanzan menos fragmentos (menos tokens y menos latencia)
+                    # (si el reranker se pasa de su presupuesto, los 10 de la primera etapa como antes)
+                    n_results = RERANK_N_RESULTS if get_reranker() is not None else CHAT_N_RESULTS
+                    results = rag.search(prompt, n_results=n_results, query_embedding=query_embedding,
+                                         n_fallback=CHAT_N_RESULTS)
+                    
+                    if not (results and results['documents'] and results['documents'][0]):
+                        st.error("⚠️ No se encontró información relevante en la base de datos.")
+                        st.info("💡 Intenta reformular tu pregunta o usa términos más específicos.")
+                        return
+                    
+                    # Embedding + búsqueda de la primera pregunta del proceso (¿alcanzó el precalentamiento?)
+                    if arranque.registrar("primera búsqueda", time.perf_counter() - inicio):
+                        print(arranque.reporte())
+                    
+                    # Unir fragmentos contiguos y recortar al presupuesto
+                    contexto = construir_contexto(
+                        results['documents'][0], results['metadatas'][0], CONTEXT_TOKENS_BUDGET
+                    )
+                    metadatas = contexto['metadatas']
+                    response = rag.generate_response(prompt, contexto['passages'])
+                
+                st.markdown(f"*{get_mensaje_motivacional()}*")
+                
+                response_placeholder = st.empty()
+                full_response = ""
+                prompt_tokens = None
+                
+                if response:
+                    for chunk in response:
+                        # Las respuestas de la caché llegan como texto, las de Groq como chunks
+                        if isinstance(chunk, str):
+                            piece = chunk
+                        else:
+                            piece = chunk.choices[0].delta.content if chunk.choices else None
+                            # El último chunk trae el uso real de tokens que midió Groq
+                            usage = chunk.usage or (chunk.x_groq.usage if chunk.x_groq else None)
+                            if usage is not None:
+                                prompt_tokens = usage.prompt_tokens
+                        if piece:
+                            full_response += piece
+                            response_placeholder.markdown(full_response + "▌")
+                
+                response_placeholder.markdown(full_response)
+                
+                if not cached:
+                    # Tokens del prompt: los de Groq; si no llegaron, el conteo local (estimado sin tiktoken)
+                    if prompt_tokens is not None:
+                        tokens_prompt = f"{prompt_tokens} tokens"
+                    elif conteo_exacto():
+                        tokens_prompt = f"{rag.last_prompt_tokens} tokens"
+                    else:
+                        tokens_prompt = f"~{rag.last_prompt_tokens} tokens (estimado)"
+                    print(
+                        f"📏 Prompt: {tokens_prompt} "
+                        f"(contexto {contexto['tokens']}, sin unir {contexto['tokens_sin_unir']})"
+                    )
+                
+                if not cached and full_response:
+                    answer_cache.store(prompt, full_response, metadatas, query_embedding, version)
+                
+                with st.expander("📄 Fuentes consultadas"):
+                    for metadata in metadatas:
+                        st.text(f"• {describir_fuente(metadata)}")
+                    if not cached:
+                        st.caption(
+                            f"Prompt: {tokens_prompt} · contexto "
+                            f"{contexto['tokens']} de {contexto['tokens_sin_unir']} sin unir"
+                        )
+                
+                st.session_state.messages.append({
+                    "role": "assistant",
+                    "content": full_response
+                })
+            except Exception as e:
+                st.error(f"❌ Error al procesar la solicitud: {str(e)}")
+                st.warning("Posibles causas: problema con la API de Groq, límite de tasa excedido, o API key inválida.")
+                import traceback
+                with st.expander("🔍 Ver detalles técnicos del error"):
+                    st.code(traceback.format_exc())
+
 # ==================== MAIN APP ====================
 
 def main():
+    # Una vez por proceso: precargar en segundo plano mientras se dibuja la página
+    precalentar_sistema()
+    
     # Inicializar sistema RAG (usa caché global)
     if 'rag' not in st.session_state:
         st.session_state.rag = RAGSystem()
@@ -621,26 +950,21 @@ def main():
     # ==================== SIDEBAR ====================
     with st.sidebar:
         st.header("📋 Menú de Navegación")
-        st.success("✓ Sistema listo - Embeddings precargados")
+        if arranque.terminado.is_set():
+            st.success("✓ Sistema listo - Embeddings precargados")
+        else:
+            st.info("⏳ Precargando el modelo de embeddings...")
         
         st.divider()
         
         # Unidades del curso
         st.subheader("📚 Unidades del Curso")
         
-        unidades = {
-            "Unidad 1": "Teoría de la Integración Regional",
-            "Unidad 2": "Procesos de Integración en Europa",
-            "Unidad 3": "Instituciones de la Unión Europea",
-            "Unidad 4": "Integración Europea Actual",
-            "Unidad 5": "Integración en América"
-        }
-        
-        for unidad, tema in unidades.items():
+        for unidad, tema in UNIDADES.items():
             if st.button(f"{unidad}: {tema}", use_container_width=True):
                 st.session_state.messages.append({
                     "role": "user",
-                    "content": f"Explícame sobre {tema}"
+                    "content": prompt_unidad(tema)
                 })
                 st.session_state.generate_response_flag = True
                 st.rerun()
@@ -650,18 +974,7 @@ def main():
         # Preguntas frecuentes
         st.subheader("❓ Preguntas Frecuentes")
         
-        preguntas_freq = [
-            "¿Qué es la integración regional?",
-            "¿Cuáles son las etapas de integración económica?",
-            "¿Qué es la Unión Europea?",
-            "¿Cuáles son los objetivos del TLCAN?",
-            "¿Qué es el Mercosur?",
-            "Diferencias entre zona de libre comercio y unión aduanera",
-            "¿Qué instituciones tiene la UE?",
-            "Ejemplos de integración en América Latina"
-        ]
-        
-        for pregunta in preguntas_freq:
+        for pregunta in PREGUNTAS_FRECUENTES:
             if st.button(pregunta, use_container_width=True):
                 st.session_state.messages.append({
                     "role": "user",
@@ -675,19 +988,17 @@ def main():
         # Información de documentos procesados
         if st.session_state.docs_processed:
             st.subheader("📊 Base de Datos")
-            collection = st.session_state.rag.get_or_create_collection()
-            total_chunks = collection.count()
+            stats = get_corpus_stats(get_index_version())
             
-            if total_chunks > 0:
-                all_metadata = collection.get(limit=total_chunks)['metadatas']
-                unique_docs = set([m['source'] for m in all_metadata])
-                
-                st.metric("Fragmentos totales", total_chunks)
-                st.metric("Documentos", len(unique_docs))
+            # Resumen precalculado al indexar: no recorre la colección en cada rerun
+            if stats and stats["total_chunks"] > 0:
+                st.metric("Fragmentos totales", stats["total_chunks"])
+                st.metric("Documentos", len(stats["sources"]))
                 
                 with st.expander("📄 Ver documentos"):
-                    for doc in sorted(unique_docs):
-                        st.text(f"• {doc}")
+                    for doc, info in stats["sources"].items():
+                        st.text(f"• {doc} ({info['chunks']} fragmentos)")
+                    st.caption(f"Índice generado: {stats['built_at']}")
         
         st.divider()
         
@@ -887,46 +1198,7 @@ def main():
         if not st.session_state.docs_processed:
             st.warning("⚠️ Por favor, procesa los documentos primero")
         else:
-            with st.chat_message("assistant"):
-                with st.spinner("Buscando información..."):
-                    try:
-                        results = st.session_state.rag.search(prompt, n_results=10)
-                        
-                        if results and results['documents'] and results['documents'][0]:
-                            context_docs = results['documents'][0]
-                            
-                            st.markdown(f"*{get_mensaje_motivacional()}*")
-                            
-                            response_placeholder = st.empty()
-                            full_response = ""
-                            
-                            response = st.session_state.rag.generate_response(prompt, context_docs)
-                            
-                            if response:
-                                for chunk in response:
-                                    if chunk.choices[0].delta.content:
-                                        full_response += chunk.choices[0].delta.content
-                                        response_placeholder.markdown(full_response + "▌")
-                            
-                            response_placeholder.markdown(full_response)
-                            
-                            with st.expander("📄 Fuentes consultadas"):
-                                for metadata in results['metadatas'][0]:
-                                    st.text(f"• {metadata['source']} (fragmento {metadata['chunk']+1}/{metadata['total_chunks']})")
-                            
-                            st.session_state.messages.append({
-                                "role": "assistant",
-                                "content": full_response
-                            })
-                        else:
-                            st.error("⚠️ No se encontró información relevante en la base de datos.")
-                            st.info("💡 Intenta reformular tu pregunta o usa términos más específicos.")
-                    except Exception as e:
-                        st.error(f"❌ Error al procesar la solicitud: {str(e)}")
-                        st.warning("Posibles causas: problema con la API de Groq, límite de tasa excedido, o API key inválida.")
-                        import traceback
-                        with st.expander("🔍 Ver detalles técnicos del error"):
-                            st.code(traceback.format_exc())
+            mostrar_respuesta(prompt)
     
     # Input de usuario
     if prompt := st.chat_input("Escribe tu pregunta aquí..."):
@@ -938,46 +1210,7 @@ def main():
         with st.chat_message("user"):
             st.markdown(prompt)
         
-        with st.chat_message("assistant"):
-            with st.spinner("Buscando información..."):
-                try:
-                    results = st.session_state.rag.search(prompt, n_results=10)
-                    
-                    if results and results['documents'] and results['documents'][0]:
-                        context_docs = results['documents'][0]
-                        
-                        st.markdown(f"*{get_mensaje_motivacional()}*")
-                        
-                        response_placeholder = st.empty()
-                        full_response = ""
-                        
-                        response = st.session_state.rag.generate_response(prompt, context_docs)
-                        
-                        if response:
-                            for chunk in response:
-                                if chunk.choices[0].delta.content:
-                                    full_response += chunk.choices[0].delta.content
-                                    response_placeholder.markdown(full_response + "▌")
-                        
-                        response_placeholder.markdown(full_response)
-                        
-                        with st.expander("📄 Fuentes consultadas"):
-                            for metadata in results['metadatas'][0]:
-                                st.text(f"• {metadata['source']} (fragmento {metadata['chunk']+1}/{metadata['total_chunks']})")
-                        
-                        st.session_state.messages.append({
-                            "role": "assistant",
-                            "content": full_response
-                        })
-                    else:
-                        st.error("⚠️ No se encontró información relevante en la base de datos.")
-                        st.info("💡 Intenta reformular tu pregunta o usa términos más específicos.")
-                except Exception as e:
-                    st.error(f"❌ Error al procesar la solicitud: {str(e)}")
-                    st.warning("Posibles causas: problema con la API de Groq, límite de tasa excedido, o API key inválida.")
-                    import traceback
-                    with st.expander("🔍 Ver detalles técnicos del error"):
-                        st.code(traceback.format_exc())
+        mostrar_respuesta(prompt)
 
 if __name__ == "__main__":
     main()
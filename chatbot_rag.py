@@ -6,6 +6,14 @@ import chromadb
 from chromadb.config import Settings
 from datetime import datetime
 import random
+import time
+from embeddings import CachedEmbedder, OllamaBackend, get_backend, backend_de_coleccion, normalizar_backend, BACKEND_KEY
+from chunking import dividir_en_chunks, metadatos_paginas, describir_fuente, CHUNK_TOKENS
+from preprocess_embeddings import (
+    iter_batches, DEFAULT_BATCH_SIZE, MANIFEST_FILE,
+    build_corpus_stats, save_corpus_stats, load_corpus_stats, corpus_stats_from_collection
+)
+from contenido_curso import UNIDADES, PREGUNTAS_FRECUENTES, prompt_unidad
 
 # Configurar página
 st.set_page_config(
@@ -15,15 +23,73 @@ st.set_page_config(
     initial_sidebar_state="expanded"
 )
 
+# Backend de embeddings de los índices que construye esta app (por defecto Ollama);
+# para consultar un índice existente se usa siempre el backend con que se construyó
+EMBEDDING_BACKEND = os.getenv("ECOBOT_EMBEDDINGS", "ollama")
+
+# ==================== CACHÉ GLOBAL DE CHROMADB ====================
+@st.cache_resource
+def get_chroma_client():
+    """Abre ChromaDB una sola vez por proceso"""
+    return chromadb.PersistentClient(path="./chroma_db")
+
+def get_index_version():
+    """Marca de la última reconstrucción con preprocess_embeddings.py (fecha del manifest)"""
+    try:
+        return os.path.getmtime(MANIFEST_FILE)
+    except OSError:
+        return None
+
+@st.cache_resource(max_entries=1)
+def get_collection(name="documentos_curso", index_version=None):
+    """Resuelve la colección una sola vez por proceso y por versión del índice"""
+    client = get_chroma_client()
+    try:
+        return client.get_collection(name)
+    except Exception:
+        return client.create_collection(
+            name=name,
+            metadata={"hnsw:space": "cosine", BACKEND_KEY: normalizar_backend(EMBEDDING_BACKEND)}
+        )
+
+@st.cache_resource(max_entries=1)
+def get_embedder(index_version=None, batch_size=32, workers=4):
+    """Embedder (con caché en disco) del backend con el que se indexó la colección"""
+    backend = get_backend(backend_de_coleccion(get_collection("documentos_curso", index_version)))
+    if isinstance(backend, OllamaBackend):
+        backend.batch_size = batch_size
+        backend.workers = workers
+    return CachedEmbedder(backend)
+
+@st.cache_resource(max_entries=1)
+def get_corpus_stats(index_version=None):
+    """Resumen del corpus (fragmentos por documento, tamaños, fecha del índice) para el sidebar"""
+    stats = load_corpus_stats()
+    if stats is not None:
+        return stats
+    
+    # Colección indexada antes de que existiera el resumen: calcularlo una sola vez
+    try:
+        return corpus_stats_from_collection(get_collection("documentos_curso", index_version))
+    except Exception as e:
+        print(f"⚠️ No se pudo calcular el resumen del corpus: {e}")
+        return None
+
 # ==================== CONFIGURACIÓN RAG ====================
 
 class RAGSystem:
     def __init__(self):
-        self.client = chromadb.PersistentClient(path="./chroma_db")
+        self.client = get_chroma_client()
         self.collection_name = "documentos_curso"
-        self.chunk_size = 1000
-        self.chunk_overlap = 200
+        self.chunk_tokens = CHUNK_TOKENS  # tamaño de fragmento en tokens (ver chunking.py)
         self.doc_hash_file = ".doc_hash"  # Archivo para guardar hash de documentos
+        # Embeddings: chunks por petición a Ollama y peticiones simultáneas
+        self.embed_batch_size = int(os.getenv("ECOBOT_EMBED_BATCH_SIZE", "32"))
+        self.embed_workers = int(os.getenv("ECOBOT_EMBED_WORKERS", "4"))
+    
+    @property
+    def embedder(self):
+        return get_embedder(get_index_version(), self.embed_batch_size, self.embed_workers)
         
     def get_documents_hash(self, folder_path="./documentos"):
         """Genera un hash de los documentos actuales (nombre + tamaño + fecha)"""
@@ -69,31 +135,14 @@ class RAGSystem:
             return True  # Si hay error, asumir que cambió
         
     def get_or_create_collection(self):
-        """Obtiene o crea la colección de ChromaDB"""
-        try:
-            collection = self.client.get_collection(self.collection_name)
-        except:
-            collection = self.client.create_collection(
-                name=self.collection_name,
-                metadata={"hnsw:space": "cosine"}
-            )
-        return collection
-    
-    def chunk_text(self, text, chunk_size=1000, overlap=200):
-        """Divide el texto en chunks con solapamiento"""
-        chunks = []
-        start = 0
-        text_length = len(text)
-        
-        while start < text_length:
-            end = start + chunk_size
-            chunk = text[start:end]
-            chunks.append(chunk)
-            start += chunk_size - overlap
-            
-        return chunks
-    
+        """Obtiene o crea la colección de ChromaDB (handle en caché por proceso)"""
+        return get_collection(self.collection_name, get_index_version())
     
+    def refresh_collection(self):
+        """Descarta el handle en caché y vuelve a resolver la colección"""
+        get_collection.clear()
+        get_embedder.clear()
+        return self.get_or_create_collection()
     
     def load_txt(self, txt_path):
         """Carga texto de un archivo TXT"""
@@ -104,8 +153,31 @@ class RAGSystem:
             st.error(f"Error al leer TXT {txt_path}: {e}")
             return None
     
-    def process_documents(self, folder_path="./documentos"):
-        """Procesa todos los documentos de la carpeta"""
+    def iter_chunks(self, files, sources=None):
+        """Genera (índice de archivo, id, texto, metadatos) leyendo un archivo a la vez
+        Si se pasa sources, anota {archivo: {"chunks", "chars"}} para el resumen del corpus"""
+        for idx, file_path in enumerate(files):
+            # Cargar contenido (SOLO TXT)
+            if file_path.suffix.lower() != '.txt':
+                continue  # Ignorar otros tipos de archivo
+            
+            content = self.load_txt(file_path)
+            if content:
+                # Dividir en chunks
+                chunks = dividir_en_chunks(content, self.chunk_tokens)
+                if sources is not None:
+                    sources[file_path.name] = {"chunks": len(chunks), "chars": len(content)}
+                
+                for chunk_idx, chunk in enumerate(chunks):
+                    yield idx, f"{file_path.stem}_{chunk_idx}", chunk["text"], {
+                        "source": file_path.name,
+                        "chunk": chunk_idx,
+                        "total_chunks": len(chunks),
+                        **metadatos_paginas(chunk)
+                    }
+    
+    def process_documents(self, folder_path="./documentos", batch_size=DEFAULT_BATCH_SIZE):
+        """Procesa todos los documentos de la carpeta en lotes de batch_size fragmentos"""
         collection = self.get_or_create_collection()
         
         folder = Path(folder_path)
@@ -113,10 +185,6 @@ class RAGSystem:
             st.warning(f"La carpeta {folder_path} no existe")
             return 0
         
-        documents = []
-        metadatas = []
-        ids = []
-        
         # Procesar archivos (SOLO TXT)
         files = list(folder.glob("*.txt"))
         
@@ -127,67 +195,60 @@ class RAGSystem:
         progress_bar = st.progress(0)
         status_text = st.empty()
         
-        for idx, file_path in enumerate(files):
-            status_text.text(f"Procesando: {file_path.name}...")
-            
-            # Cargar contenido (SOLO TXT)
-            if file_path.suffix.lower() == '.txt':
-                content = self.load_txt(file_path)
-            else:
-                continue  # Ignorar otros tipos de archivo
-            
-            if content:
-                # Dividir en chunks
-                chunks = self.chunk_text(content)
-                
-                for chunk_idx, chunk in enumerate(chunks):
-                    documents.append(chunk)
-                    metadatas.append({
-                        "source": file_path.name,
-                        "chunk": chunk_idx,
-                        "total_chunks": len(chunks)
-                    })
-                    ids.append(f"{file_path.stem}_{chunk_idx}")
-            
-            progress_bar.progress((idx + 1) / len(files))
+        total = 0
+        sources = {}
+        inicio = time.perf_counter()
         
-        # Agregar a ChromaDB
-        if documents:
-            status_text.text("Creando embeddings y guardando en la base de datos...")
+        # Pipeline: archivo → chunks → lote → embeddings (caché o backend) → ChromaDB
+        embedder = self.embedder
+        for batch in iter_batches(self.iter_chunks(files, sources), batch_size):
+            file_idx = batch[-1][0]
+            documents = [item[2] for item in batch]
             
-            # Generar embeddings con Ollama
-            embeddings = []
-            for doc in documents:
-                response = ollama.embeddings(model='nomic-embed-text', prompt=doc)
-                embeddings.append(response['embedding'])
+            def mostrar_avance(hechos, n):
+                status_text.text(f"Creando embeddings: {files[file_idx].name}... ({total + hechos} fragmentos)")
+            
+            # Embeddings por lotes y en paralelo; los textos ya calculados no se repiten
+            embeddings = embedder.embed(documents, on_progress=mostrar_avance)
             
             collection.add(
+                ids=[item[1] for item in batch],
                 documents=documents,
                 embeddings=embeddings,
-                metadatas=metadatas,
-                ids=ids
+                metadatas=[item[3] for item in batch]
             )
-            
-            status_text.text(f"✓ Procesados {len(documents)} fragmentos de {len(files)} archivos")
+            total += len(batch)
+            progress_bar.progress((file_idx + 1) / len(files))
+        
+        if total:
+            duracion = time.perf_counter() - inicio
+            status_text.text(f"✓ Procesados {total} fragmentos de {len(files)} archivos ({total / duracion:.0f} fragmentos/s)")
             progress_bar.empty()
+            
+            save_corpus_stats(build_corpus_stats(sources, duracion))
+            get_corpus_stats.clear()
         
-        return len(documents)
+        return total
     
     def search(self, query, n_results=3):
         """Busca documentos relevantes para la consulta"""
         collection = self.get_or_create_collection()
         
-        # Generar embedding de la consulta
-        query_embedding = ollama.embeddings(
-            model='nomic-embed-text',
-            prompt=query
-        )['embedding']
+        # Embedding de la consulta con el mismo backend que el índice
+        query_embedding = self.embedder.embed_query(query)
         
         # Buscar
-        results = collection.query(
-            query_embeddings=[query_embedding],
-            n_results=n_results
-        )
+        try:
+            results = collection.query(
+                query_embeddings=[query_embedding],
+                n_results=n_results
+            )
+        except Exception:
+            # La colección se recreó desde otro proceso (preprocess_embeddings.py --full)
+            results = self.refresh_collection().query(
+                query_embeddings=[query_embedding],
+                n_results=n_results
+            )
         
         return results
     
@@ -399,19 +460,11 @@ def main():
         # Unidades del curso
         st.subheader("📚 Unidades del Curso")
         
-        unidades = {
-            "Unidad 1": "Teoría de la Integración Regional",
-            "Unidad 2": "Procesos de Integración en Europa",
-            "Unidad 3": "Instituciones de la Unión Europea",
-            "Unidad 4": "Integración Europea Actual",
-            "Unidad 5": "Integración en América"
-        }
-        
-        for unidad, tema in unidades.items():
+        for unidad, tema in UNIDADES.items():
             if st.button(f"{unidad}: {tema}", use_container_width=True):
                 st.session_state.messages.append({
                     "role": "user",
-                    "content": f"Explícame sobre {tema}"
+                    "content": prompt_unidad(tema)
                 })
                 st.session_state.generate_response_flag = True
                 st.rerun()
@@ -421,18 +474,7 @@ def main():
         # Preguntas frecuentes
         st.subheader("❓ Preguntas Frecuentes")
         
-        preguntas_freq = [
-            "¿Qué es la integración regional?",
-            "¿Cuáles son las etapas de integración económica?",
-            "¿Qué es la Unión Europea?",
-            "¿Cuáles son los objetivos del TLCAN?",
-            "¿Qué es el Mercosur?",
-            "Diferencias entre zona de libre comercio y unión aduanera",
-            "¿Qué instituciones tiene la UE?",
-            "Ejemplos de integración en América Latina"
-        ]
-        
-        for pregunta in preguntas_freq:
+        for pregunta in PREGUNTAS_FRECUENTES:
             if st.button(pregunta, use_container_width=True):
                 st.session_state.messages.append({
                     "role": "user",
@@ -446,20 +488,17 @@ def main():
         # Información de documentos procesados
         if st.session_state.docs_processed:
             st.subheader("📊 Base de Datos")
-            collection = st.session_state.rag.get_or_create_collection()
-            total_chunks = collection.count()
+            stats = get_corpus_stats(get_index_version())
             
-            # Obtener documentos únicos
-            if total_chunks > 0:
-                all_metadata = collection.get(limit=total_chunks)['metadatas']
-                unique_docs = set([m['source'] for m in all_metadata])
-                
-                st.metric("Fragmentos totales", total_chunks)
-                st.metric("Documentos", len(unique_docs))
+            # Resumen precalculado al indexar: no recorre la colección en cada rerun
+            if stats and stats["total_chunks"] > 0:
+                st.metric("Fragmentos totales", stats["total_chunks"])
+                st.metric("Documentos", len(stats["sources"]))
                 
                 with st.expander("📄 Ver documentos"):
-                    for doc in sorted(unique_docs):
-                        st.text(f"• {doc}")
+                    for doc, info in stats["sources"].items():
+                        st.text(f"• {doc} ({info['chunks']} fragmentos)")
+                    st.caption(f"Índice generado: {stats['built_at']}")
         
         st.divider()
         
@@ -619,7 +658,7 @@ def main():
                             # Mostrar fuentes
                             with st.expander("📄 Fuentes consultadas"):
                                 for metadata in results['metadatas'][0]:
-                                    st.text(f"• {metadata['source']} (fragmento {metadata['chunk']+1}/{metadata['total_chunks']})")
+                                    st.text(f"• {describir_fuente(metadata)}")
                             
                             st.session_state.messages.append({
                                 "role": "assistant",
@@ -668,7 +707,7 @@ def main():
                         # Mostrar fuentes
                         with st.expander("📄 Fuentes consultadas"):
                             for metadata in results['metadatas'][0]:
-                                st.text(f"• {metadata['source']} (fragmento {metadata['chunk']+1}/{metadata['total_chunks']})")
+                                st.text(f"• {describir_fuente(metadata)}")
                         
                         st.session_state.messages.append({
                             "role": "assistant",
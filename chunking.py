@@ -0,0 +1,158 @@
+"""
+División de documentos en fragmentos respetando su estructura: las marcas
+`--- PÁGINA n ---` que escribe pdfs_to_txt.py, párrafos y oraciones. El
+tamaño se mide en tokens (tiktoken si está instalado, si no una estimación)
+y cada fragmento guarda las páginas que abarca.
+"""
+
+import re
+from functools import lru_cache
+
+# Tokens por fragmento: ~1.100 caracteres de texto en español
+CHUNK_TOKENS = 300
+
+_MARCA_PAGINA = re.compile(r"^[ \t]*--- PÁGINA (\d+) ---[ \t]*$", re.MULTILINE)
+_PIEZAS = re.compile(r"\w+|[^\w\s]")
+
+# Separadores del más al menos natural: párrafo, oración, línea, palabra
+_PARRAFOS = re.compile(r"\n[ \t]*\n\s*")
+_SEPARADORES = [
+    re.compile(r"(?<=[.!?…])\s+"),
+    re.compile(r"\s*\n\s*"),
+    re.compile(r"\s+"),
+]
+
+
+@lru_cache(maxsize=1)
+def _encoding():
+    """Codificación de tiktoken, cargada en el primer conteo (la primera vez puede
+    descargar el vocabulario: no en el import, que bloquearía el arranque de la app)"""
+    try:
+        import tiktoken
+        return tiktoken.get_encoding("cl100k_base")
+    except Exception:
+        # tiktoken es opcional: sin él se estima
+        return None
+
+
+def conteo_exacto():
+    """False si los conteos son una estimación (sin tiktoken); la app lo indica al mostrarlos"""
+    return _encoding() is not None
+
+
+def contar_tokens(texto):
+    """Tokens del texto (exacto con tiktoken, estimado por palabras si no está)"""
+    if not texto:
+        return 0
+    encoding = _encoding()
+    if encoding is not None:
+        return len(encoding.encode(texto, disallowed_special=()))
+    return round(len(_PIEZAS.findall(texto)) * 1.25)
+
+
+def dividir_paginas(texto):
+    """[(número de página o None, texto)] según las marcas de pdfs_to_txt.py"""
+    partes = _MARCA_PAGINA.split(texto)
+    # Con el grupo de la regex: [antes, n1, texto1, n2, texto2, ...]
+    paginas = [(None, partes[0])] if partes[0].strip() else []
+    for i in range(1, len(partes), 2):
+        paginas.append((int(partes[i]), partes[i + 1]))
+    return paginas
+
+
+def _tramos(texto, patron, inicio, fin):
+    """Posiciones (inicio, fin) de los tramos de texto[inicio:fin] separados por patron"""
+    tramos = []
+    pos = inicio
+    for m in patron.finditer(texto, inicio, fin):
+        tramos.append((pos, m.start()))
+        pos = m.end()
+    tramos.append((pos, fin))
+    return [(a, b) for a, b in tramos if texto[a:b].strip()]
+
+
+def _unidades(texto, inicio, fin, max_tokens, nivel=0):
+    """Divide un tramo hasta que cada parte quepa en max_tokens (oraciones, luego líneas, luego palabras)"""
+    tokens = contar_tokens(texto[inicio:fin])
+    if tokens <= max_tokens or nivel == len(_SEPARADORES):
+        return [(inicio, fin, tokens)]
+    return [
+        unidad
+        for a, b in _tramos(texto, _SEPARADORES[nivel], inicio, fin)
+        for unidad in _unidades(texto, a, b, max_tokens, nivel + 1)
+    ]
+
+
+def _armar(paginas, grupo):
+    """Texto y rango de páginas de un grupo de unidades consecutivas"""
+    partes = []
+    for idx, inicio, fin, _ in grupo:
+        if partes and partes[-1][0] == idx:
+            # Misma página: un solo corte del texto original (conserva sus saltos de línea)
+            partes[-1][2] = fin
+        else:
+            partes.append([idx, inicio, fin])
+    numeros = [paginas[idx][0] for idx, _, _, _ in grupo if paginas[idx][0] is not None]
+    return {
+        "text": "\n\n".join(paginas[idx][1][inicio:fin] for idx, inicio, fin in partes),
+        "page_start": numeros[0] if numeros else None,
+        "page_end": numeros[-1] if numeros else None,
+        "tokens": sum(u[3] for u in grupo),
+    }
+
+
+def dividir_en_chunks(texto, max_tokens=CHUNK_TOKENS):
+    """Divide un documento en fragmentos de hasta max_tokens sin cortar oraciones.
+
+    Devuelve [{"text", "page_start", "page_end", "tokens"}]; las páginas son
+    None si el texto no trae marcas de página.
+    """
+    paginas = dividir_paginas(texto)
+
+    # Unidades mínimas (índice de página, inicio, fin, tokens) en orden de lectura
+    unidades = []
+    for idx, (_, contenido) in enumerate(paginas):
+        for a, b in _tramos(contenido, _PARRAFOS, 0, len(contenido)):
+            # Recortar espacios de los bordes del párrafo
+            a += len(contenido[a:b]) - len(contenido[a:b].lstrip())
+            b -= len(contenido[a:b]) - len(contenido[a:b].rstrip())
+            unidades.extend((idx, *u) for u in _unidades(contenido, a, b, max_tokens))
+
+    # Juntar unidades consecutivas mientras quepan (varias páginas cortas pueden ir juntas)
+    grupos = []
+    tokens = 0
+    for unidad in unidades:
+        if grupos and tokens + unidad[3] <= max_tokens:
+            grupos[-1].append(unidad)
+            tokens += unidad[3]
+        else:
+            grupos.append([unidad])
+            tokens = unidad[3]
+
+    # Un último fragmento muy corto se une al anterior
+    if len(grupos) > 1 and tokens < max_tokens // 4:
+        grupos[-2].extend(grupos.pop())
+
+    return [_armar(paginas, grupo) for grupo in grupos]
+
+
+def metadatos_paginas(chunk):
+    """Metadatos de página para ChromaDB (no admite None, se omiten si no hay marcas)"""
+    if chunk["page_start"] is None:
+        return {}
+    return {"page_start": chunk["page_start"], "page_end": chunk["page_end"]}
+
+
+def describir_fuente(metadata):
+    """Texto para "Fuentes consultadas": archivo, fragmento, páginas y otras fuentes si las hay"""
+    texto = f"{metadata['source']} (fragmento {metadata['chunk'] + 1}/{metadata['total_chunks']}"
+    if metadata.get("page_start") is not None:
+        paginas = metadata["page_start"]
+        if metadata["page_end"] != metadata["page_start"]:
+            paginas = f"{metadata['page_start']}-{metadata['page_end']}"
+        texto += f", pág. {paginas}"
+    texto += ")"
+    if metadata.get("alt_sources"):
+        # Casi duplicados de otros archivos que no se indexaron (ver dedup.py)
+        texto += f" · también en: {metadata['alt_sources']}"
+    return texto
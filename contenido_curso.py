@@ -0,0 +1,44 @@
+"""
+Textos fijos del curso que usan las apps: unidades, preguntas frecuentes y
+consultas del quiz. preprocess_embeddings.py precalcula sus embeddings y
+candidatos al indexar, así que cambiar estos textos requiere reindexar.
+"""
+
+UNIDADES = {
+    "Unidad 1": "Teoría de la Integración Regional",
+    "Unidad 2": "Procesos de Integración en Europa",
+    "Unidad 3": "Instituciones de la Unión Europea",
+    "Unidad 4": "Integración Europea Actual",
+    "Unidad 5": "Integración en América"
+}
+
+PREGUNTAS_FRECUENTES = [
+    "¿Qué es la integración regional?",
+    "¿Cuáles son las etapas de integración económica?",
+    "¿Qué es la Unión Europea?",
+    "¿Cuáles son los objetivos del TLCAN?",
+    "¿Qué es el Mercosur?",
+    "Diferencias entre zona de libre comercio y unión aduanera",
+    "¿Qué instituciones tiene la UE?",
+    "Ejemplos de integración en América Latina"
+]
+
+# Consultas para buscar el contexto de las preguntas del quiz (se elige una al azar)
+CONSULTAS_QUIZ = [
+    "integración regional Europa instituciones Unión Europea",
+    "América Latina Mercosur TLCAN integración económica",
+    "tratados europeos Maastricht Roma Lisboa",
+    "teorías integración regional supranacional intergubernamental",
+    "Brexit consecuencias política europea comercio",
+    "zonas libre comercio uniones aduaneras mercado común"
+]
+
+
+def prompt_unidad(tema):
+    """Pregunta que se envía al pulsar el botón de una unidad"""
+    return f"Explícame sobre {tema}"
+
+
+def consultas_predefinidas():
+    """Todas las consultas fijas que pueden llegar a search()"""
+    return [prompt_unidad(tema) for tema in UNIDADES.values()] + PREGUNTAS_FRECUENTES + CONSULTAS_QUIZ
@@ -0,0 +1,75 @@
+"""
+Arma el [CONTEXTO] del prompt a partir de los fragmentos recuperados: une
+los fragmentos contiguos de un mismo archivo en un solo pasaje, los ordena
+por relevancia y recorta al presupuesto de tokens.
+"""
+
+import re
+
+from chunking import contar_tokens
+
+CONTEXT_TOKENS = 2500   # presupuesto del contexto por pregunta
+MIN_TOKENS = 60         # no vale la pena agregar un pasaje recortado más corto
+
+_FIN_ORACION = re.compile(r"[.!?…]\s|\n")
+
+
+def recortar(texto, max_tokens):
+    """Recorta texto al último fin de oración que quepa en max_tokens"""
+    while texto and contar_tokens(texto) > max_tokens:
+        # Estimar el corte por proporción y retroceder al fin de oración más cercano
+        limite = int(len(texto) * max_tokens / contar_tokens(texto) * 0.95)
+        cortes = [m.end() for m in _FIN_ORACION.finditer(texto, 0, limite)]
+        texto = texto[:cortes[-1] if cortes else limite].rstrip()
+    return texto
+
+
+def construir_contexto(documents, metadatas, max_tokens=CONTEXT_TOKENS):
+    """Pasajes para el prompt a partir de los resultados de búsqueda (en orden de relevancia).
+
+    Devuelve {"passages": [texto], "metadatas": [metadatos usados],
+    "tokens": tokens del contexto, "tokens_sin_unir": tokens de unir todo tal cual}.
+    """
+    # Agrupar por archivo los fragmentos con índice consecutivo; cada pasaje
+    # queda en la posición de su fragmento más relevante
+    pasajes = []          # [[(chunk, texto, metadata)]]
+    por_fragmento = {}    # (archivo, chunk) -> pasaje
+    for doc, meta in zip(documents, metadatas):
+        source, chunk = meta.get("source"), meta.get("chunk")
+        vecino = None
+        if chunk is not None:
+            vecino = por_fragmento.get((source, chunk - 1)) or por_fragmento.get((source, chunk + 1))
+        if vecino is None:
+            vecino = []
+            pasajes.append(vecino)
+        vecino.append((chunk, doc, meta))
+        por_fragmento[(source, chunk)] = vecino
+
+    passages, usados = [], []
+    total = 0
+    for pasaje in pasajes:
+        # Los fragmentos de chunking.py no se solapan: basta con unirlos en orden
+        partes = sorted(pasaje, key=lambda c: c[0] if c[0] is not None else 0)
+        texto = "\n".join(doc for _, doc, _ in partes)
+
+        tokens = contar_tokens(texto)
+        if total + tokens > max_tokens:
+            # Lo que queda del presupuesto se llena con el inicio del pasaje
+            restante = max_tokens - total
+            if restante < MIN_TOKENS:
+                break
+            texto = recortar(texto, restante)
+            tokens = contar_tokens(texto)
+            if not texto:
+                break
+
+        passages.append(texto)
+        usados.extend(meta for _, _, meta in partes)
+        total += tokens
+
+    return {
+        "passages": passages,
+        "metadatas": usados,
+        "tokens": total,
+        "tokens_sin_unir": contar_tokens("\n\n".join(documents)),
+    }
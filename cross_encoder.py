@@ -0,0 +1,107 @@
+"""
+Segunda etapa opcional de ranking: un cross-encoder pequeño (ONNX Runtime en
+CPU, idealmente cuantizado a int8) puntúa cada par (pregunta, fragmento) de
+los candidatos de la primera etapa. Tiene un presupuesto de latencia: si no
+termina a tiempo se devuelve el orden de la primera etapa.
+
+Preparar un modelo (una vez, con `pip install onnx`):
+    python cross_encoder.py --quantize modelo/model.onnx
+La carpeta del modelo debe tener tokenizer.json y model_quantized.onnx (o model.onnx).
+"""
+
+import argparse
+import os
+import time
+from pathlib import Path
+
+import numpy as np
+
+RERANK_CANDIDATES = 20    # candidatos de la primera etapa que se vuelven a puntuar
+RERANK_TOP_K = 5          # fragmentos que se envían a Groq con el reranker activo
+RERANK_BUDGET_MS = 300    # presupuesto por pregunta; pasado se usa el orden de la primera etapa
+MAX_LENGTH = 256          # tokens por par (pregunta + fragmento)
+BATCH_SIZE = 8
+
+
+class CrossEncoderReranker:
+    """Cross-encoder ONNX (p. ej. cross-encoder/mmarco-mMiniLMv2-L12-H384-v1, multilingüe)"""
+
+    def __init__(self, model_dir, max_length=MAX_LENGTH, batch_size=BATCH_SIZE, threads=None):
+        import onnxruntime as ort
+        from tokenizers import Tokenizer
+
+        model_dir = Path(model_dir)
+        model_path = model_dir / "model_quantized.onnx"
+        if not model_path.exists():
+            model_path = model_dir / "model.onnx"
+
+        options = ort.SessionOptions()
+        options.intra_op_num_threads = threads or min(4, os.cpu_count() or 1)
+        self.session = ort.InferenceSession(str(model_path), options, providers=["CPUExecutionProvider"])
+        self.inputs = {i.name for i in self.session.get_inputs()}
+        self.name = f"{model_dir.name}/{model_path.name}"
+
+        self.tokenizer = Tokenizer.from_file(str(model_dir / "tokenizer.json"))
+        self.tokenizer.enable_truncation(max_length)
+        self.tokenizer.enable_padding()
+        self.batch_size = batch_size
+
+    def _puntuar_lote(self, query, textos):
+        encodings = self.tokenizer.encode_batch([(query, texto) for texto in textos])
+        feed = {
+            "input_ids": np.array([e.ids for e in encodings], dtype=np.int64),
+            "attention_mask": np.array([e.attention_mask for e in encodings], dtype=np.int64),
+            "token_type_ids": np.array([e.type_ids for e in encodings], dtype=np.int64),
+        }
+        logits = self.session.run(None, {k: v for k, v in feed.items() if k in self.inputs})[0]
+        # Un logit de relevancia por par (o dos clases: la segunda es "relevante")
+        return logits[:, -1] if logits.ndim == 2 else logits
+
+    def puntuar(self, query, textos, budget_ms=RERANK_BUDGET_MS):
+        """Relevancia de cada texto para query (float32[n]); None si se acaba el presupuesto
+        antes de empezar algún lote"""
+        limite = time.perf_counter() + budget_ms / 1000
+        scores = []
+        for i in range(0, len(textos), self.batch_size):
+            if time.perf_counter() > limite:
+                return None
+            scores.append(self._puntuar_lote(query, textos[i:i + self.batch_size]))
+        # El presupuesto solo se revisa entre lotes: si todos terminaron, los scores valen
+        return np.concatenate(scores).astype(np.float32) if scores else np.zeros(0, dtype=np.float32)
+
+    def reordenar(self, query, textos, n, budget_ms=RERANK_BUDGET_MS):
+        """Índices de los n textos más relevantes, en orden; None si no alcanzó el tiempo"""
+        scores = self.puntuar(query, textos, budget_ms)
+        if scores is None:
+            return None
+        return np.argsort(-scores, kind="stable")[:n]
+
+
+def quantize(model_path):
+    """Cuantiza los pesos a int8 (dinámico) junto al modelo original: model_quantized.onnx"""
+    try:
+        from onnxruntime.quantization import quantize_dynamic, QuantType
+    except ImportError:
+        raise SystemExit("❌ La cuantización necesita: pip install onnx")
+    model_path = Path(model_path)
+    destino = model_path.with_name("model_quantized.onnx")
+    quantize_dynamic(str(model_path), str(destino), weight_type=QuantType.QInt8)
+    return destino
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Prepara y prueba el cross-encoder ONNX")
+    parser.add_argument("--quantize", metavar="MODEL_ONNX", help="Cuantiza a int8 un model.onnx exportado")
+    parser.add_argument("--probar", metavar="MODEL_DIR", help="Mide la latencia con textos de ejemplo")
+    args = parser.parse_args()
+
+    if args.quantize:
+        destino = quantize(args.quantize)
+        print(f"✅ Modelo cuantizado en {destino}")
+    if args.probar:
+        reranker = CrossEncoderReranker(args.probar)
+        textos = ["El Mercosur es un proceso de integración regional de América del Sur."] * RERANK_CANDIDATES
+        reranker.puntuar("¿Qué es el Mercosur?", textos, budget_ms=10_000)
+        inicio = time.perf_counter()
+        reranker.puntuar("¿Qué es el Mercosur?", textos, budget_ms=10_000)
+        print(f"⏱️ {reranker.name}: {RERANK_CANDIDATES} candidatos en {(time.perf_counter() - inicio) * 1000:.0f} ms")
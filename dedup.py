@@ -0,0 +1,94 @@
+"""
+Detección de fragmentos casi duplicados con MinHash + LSH.
+En preprocess_embeddings.py solo se indexa el primer fragmento de cada grupo
+(el canónico); las demás fuentes quedan en su metadato alt_sources.
+"""
+
+import zlib
+
+import numpy as np
+
+from keywords import tokenizar
+
+NUM_PERM = 128      # tamaño de la firma MinHash
+BANDS = 32          # 32 bandas de 4 filas: son candidatos desde ~50% de similitud
+THRESHOLD = 0.8     # Jaccard estimado mínimo para considerarlo duplicado
+SHINGLE = 5         # palabras por shingle
+MIN_SHINGLES = 8    # fragmentos más cortos no se comparan (títulos, índices)
+ALT_SEP = " | "     # separador de fuentes en alt_sources (ChromaDB no guarda listas)
+
+_MASK = np.uint64(0xFFFFFFFF)
+
+
+class MinHasher:
+    """Firma MinHash de los shingles de palabras de un texto"""
+
+    def __init__(self, num_perm=NUM_PERM, shingle=SHINGLE, seed=1):
+        rng = np.random.default_rng(seed)
+        # (a·x + b) mod 2^32 con a impar es una permutación de los hashes de 32 bits
+        self.a = rng.integers(1, 2**32, num_perm, dtype=np.uint64) | np.uint64(1)
+        self.b = rng.integers(0, 2**32, num_perm, dtype=np.uint64)
+        self.shingle = shingle
+
+    def shingles(self, text):
+        tokens = tokenizar(text)
+        k = self.shingle
+        return {" ".join(tokens[i:i + k]) for i in range(len(tokens) - k + 1)}
+
+    def signature(self, text):
+        """Firma uint64[num_perm]; None si el texto es demasiado corto para compararlo"""
+        shingles = self.shingles(text)
+        if len(shingles) < MIN_SHINGLES:
+            return None
+        x = np.fromiter((zlib.crc32(s.encode("utf-8")) for s in shingles), dtype=np.uint64, count=len(shingles))
+        return ((self.a[:, None] * x[None, :] + self.b[:, None]) & _MASK).min(axis=1)
+
+
+class NearDuplicateIndex:
+    """Índice LSH de los fragmentos canónicos vistos hasta ahora"""
+
+    def __init__(self, threshold=THRESHOLD, bands=BANDS, hasher=None):
+        self.hasher = hasher or MinHasher()
+        self.threshold = threshold
+        self.rows = len(self.hasher.a) // bands
+        self.buckets = [{} for _ in range(bands)]
+        self.signatures = {}   # id canónico -> firma
+        self.sources = {}      # id canónico -> archivo
+        self.alternates = {}   # id canónico -> [otros archivos con el mismo texto]
+
+    def _bandas(self, firma):
+        for band, buckets in enumerate(self.buckets):
+            yield buckets, firma[band * self.rows:(band + 1) * self.rows].tobytes()
+
+    def check(self, chunk_id, text, source):
+        """Devuelve el id canónico si text es casi duplicado de uno ya visto;
+        si no, lo registra como canónico y devuelve None."""
+        firma = self.hasher.signature(text)
+        if firma is None:
+            return None
+
+        candidatos = set()
+        for buckets, key in self._bandas(firma):
+            candidatos.update(buckets.get(key, ()))
+
+        mejor, mejor_sim = None, self.threshold
+        for candidato in candidatos:
+            sim = float(np.mean(self.signatures[candidato] == firma))
+            if sim >= mejor_sim:
+                mejor, mejor_sim = candidato, sim
+
+        if mejor is not None:
+            fuentes = self.alternates.setdefault(mejor, [])
+            if source != self.sources[mejor] and source not in fuentes:
+                fuentes.append(source)
+            return mejor
+
+        self.signatures[chunk_id] = firma
+        self.sources[chunk_id] = source
+        for buckets, key in self._bandas(firma):
+            buckets.setdefault(key, []).append(chunk_id)
+        return None
+
+    def alt_sources(self):
+        """{id canónico: "archivo | archivo"} de los canónicos con duplicados en otros archivos"""
+        return {chunk_id: ALT_SEP.join(fuentes) for chunk_id, fuentes in self.alternates.items() if fuentes}
@@ -0,0 +1,332 @@
+"""
+Backends de embeddings intercambiables (ChromaDB por defecto, Ollama,
+sentence-transformers y un stub determinista para pruebas) y una caché en
+SQLite por hash del texto, para no calcular dos veces el mismo fragmento
+entre reconstrucciones del índice ni entre apps.
+
+Con Ollama usa el endpoint batch `embed` cuando existe y, si no, un pool
+acotado de hilos con `embeddings` (uno por chunk). Reintenta los lotes que fallan.
+"""
+
+import hashlib
+import os
+import sqlite3
+import threading
+import time
+import zlib
+from concurrent.futures import ThreadPoolExecutor, as_completed
+from pathlib import Path
+
+import numpy as np
+
+try:
+    import ollama
+except ImportError:
+    # Solo lo necesita el backend "ollama" (la app de Groq no lo instala)
+    ollama = None
+
+EMBED_MODEL = "nomic-embed-text"
+
+# Backend por defecto: "chroma", "ollama", "sentence-transformers" o "stub", con
+# modelo opcional ("ollama:mxbai-embed-large", "stub:64")
+EMBEDDING_BACKEND = os.getenv("ECOBOT_EMBEDDINGS", "chroma")
+
+# Metadato de la colección con el backend con que se indexó (las apps consultan con el mismo)
+BACKEND_KEY = "embedding_backend"
+
+# Índices anteriores a ese metadato: se reconocen por la dimensión de sus vectores
+# (preprocess_embeddings.py con el default de Chroma o chatbot_rag.py con Ollama)
+BACKEND_SIN_MARCA = "chroma"
+BACKEND_POR_DIMENSION = {384: "chroma", 768: "ollama"}
+
+CACHE_FILE = "./chroma_db/embedding_cache.sqlite3"
+
+# Servidores de Ollama sin /api/embed: después del primer 404 se va directo a una petición por documento
+_SIN_BATCH = set()
+
+
+def _con_reintentos(fn, retries=3, backoff=0.5):
+    """Ejecuta fn() reintentando con espera exponencial"""
+    for intento in range(retries + 1):
+        try:
+            return fn()
+        except ollama.ResponseError as e:
+            # Errores del cliente (modelo inexistente, endpoint no soportado) no se reintentan
+            if intento == retries or (400 <= e.status_code < 500 and e.status_code != 429):
+                raise
+        except Exception:
+            if intento == retries:
+                raise
+        time.sleep(backoff * (2 ** intento))
+
+
+def _servidor(client):
+    """Clave del servidor de un cliente de Ollama (su URL base)"""
+    http = getattr(client, "_client", None)
+    return str(http.base_url) if http is not None else id(client)
+
+
+def _embed_lote(client, model, lote, usar_batch, retries):
+    """Embeddings de un lote: una petición batch o una por documento"""
+    if usar_batch and _servidor(client) not in _SIN_BATCH:
+        try:
+            return _con_reintentos(lambda: list(client.embed(model=model, input=lote)["embeddings"]), retries)
+        except ollama.ResponseError as e:
+            # Servidores viejos de Ollama no tienen /api/embed
+            if e.status_code != 404:
+                raise
+            _SIN_BATCH.add(_servidor(client))
+    return [
+        _con_reintentos(lambda doc=doc: client.embeddings(model=model, prompt=doc)["embedding"], retries)
+        for doc in lote
+    ]
+
+
+def embed_ollama(documents, model=EMBED_MODEL, batch_size=32, workers=4, retries=3,
+                 client=None, on_progress=None):
+    """Devuelve los embeddings de documents (en el mismo orden)
+
+    batch_size: documentos por petición
+    workers: peticiones en vuelo al mismo tiempo
+    on_progress(hechos, total): se llama desde el hilo que invoca, sirve para st.progress
+    """
+    client = client or ollama.Client()
+    usar_batch = hasattr(client, "embed")
+    total = len(documents)
+    lotes = [(i, documents[i:i + batch_size]) for i in range(0, total, batch_size)]
+    resultado = [None] * total
+    hechos = 0
+
+    with ThreadPoolExecutor(max_workers=max(1, workers)) as pool:
+        futuros = {
+            pool.submit(_embed_lote, client, model, lote, usar_batch, retries): (inicio, len(lote))
+            for inicio, lote in lotes
+        }
+        for futuro in as_completed(futuros):
+            inicio, n = futuros[futuro]
+            resultado[inicio:inicio + n] = futuro.result()
+            hechos += n
+            if on_progress:
+                on_progress(hechos, total)
+
+    return resultado
+
+
+# ==================== BACKENDS ====================
+
+class EmbeddingBackend:
+    """Interfaz común: name ("tipo:modelo") identifica los vectores en la caché y en
+    la colección; embed(textos) devuelve un vector float32 por texto"""
+
+    name = None
+
+    def embed(self, texts, on_progress=None):
+        raise NotImplementedError
+
+
+class ChromaDefaultBackend(EmbeddingBackend):
+    """all-MiniLM-L6-v2 en ONNX, el embedder implícito de ChromaDB (384 dimensiones)"""
+
+    def __init__(self, model="all-MiniLM-L6-v2"):
+        from chromadb.utils import embedding_functions
+        self.name = f"chroma:{model}"
+        self._fn = embedding_functions.DefaultEmbeddingFunction()
+
+    def embed(self, texts, on_progress=None):
+        return [np.asarray(v, dtype=np.float32) for v in self._fn(list(texts))]
+
+
+class OllamaBackend(EmbeddingBackend):
+    """Modelo de Ollama (por defecto nomic-embed-text, 768 dimensiones) con embed_ollama"""
+
+    def __init__(self, model=EMBED_MODEL, batch_size=32, workers=4, client=None):
+        if ollama is None:
+            raise ImportError("El backend 'ollama' necesita el paquete ollama (pip install ollama)")
+        self.name = f"ollama:{model}"
+        self.model = model
+        self.batch_size = batch_size
+        self.workers = workers
+        self.client = client
+
+    def embed(self, texts, on_progress=None):
+        vectores = embed_ollama(list(texts), self.model, self.batch_size, self.workers,
+                                client=self.client, on_progress=on_progress)
+        return [np.asarray(v, dtype=np.float32) for v in vectores]
+
+
+class SentenceTransformerBackend(EmbeddingBackend):
+    """Modelo de sentence-transformers (PyTorch), normalizado"""
+
+    def __init__(self, model="sentence-transformers/all-MiniLM-L6-v2"):
+        try:
+            from sentence_transformers import SentenceTransformer
+        except ImportError:
+            raise ImportError("El backend 'sentence-transformers' necesita: pip install sentence-transformers")
+        self.name = f"sentence-transformers:{model}"
+        self._model = SentenceTransformer(model)
+
+    def embed(self, texts, on_progress=None):
+        vectores = self._model.encode(list(texts), convert_to_numpy=True, normalize_embeddings=True)
+        return list(vectores.astype(np.float32))
+
+
+class StubBackend(EmbeddingBackend):
+    """Vectores deterministas por hashing de palabras: pruebas sin modelo ni red"""
+
+    def __init__(self, model="256"):
+        from keywords import tokenizar
+        self.name = f"stub:{model}"
+        self.dim = int(model)
+        self._tokenizar = tokenizar
+
+    def embed(self, texts, on_progress=None):
+        vectores = []
+        for text in texts:
+            v = np.zeros(self.dim, dtype=np.float32)
+            for palabra in self._tokenizar(text):
+                v[zlib.crc32(palabra.encode("utf-8")) % self.dim] += 1
+            norma = np.linalg.norm(v)
+            vectores.append(v / norma if norma else v)
+        return vectores
+
+
+BACKENDS = {
+    "chroma": (ChromaDefaultBackend, "all-MiniLM-L6-v2"),
+    "ollama": (OllamaBackend, EMBED_MODEL),
+    "sentence-transformers": (SentenceTransformerBackend, "sentence-transformers/all-MiniLM-L6-v2"),
+    "stub": (StubBackend, "256"),
+}
+
+
+def normalizar_backend(spec):
+    """"ollama" -> "ollama:nomic-embed-text" (el nombre que usan la caché y la colección)"""
+    tipo, _, model = (spec or EMBEDDING_BACKEND).partition(":")
+    if tipo not in BACKENDS:
+        raise ValueError(f"Backend de embeddings desconocido: {tipo} (opciones: {', '.join(BACKENDS)})")
+    return f"{tipo}:{model or BACKENDS[tipo][1]}"
+
+
+def get_backend(spec=None):
+    """Instancia el backend de spec ("tipo" o "tipo:modelo"; por defecto ECOBOT_EMBEDDINGS)"""
+    tipo, model = normalizar_backend(spec).split(":", 1)
+    return BACKENDS[tipo][0](model)
+
+
+def backend_de_coleccion(collection):
+    """Backend con el que se indexó la colección; sin el metadato, según la dimensión
+    de los vectores guardados (BACKEND_SIN_MARCA si está vacía)"""
+    backend = (collection.metadata or {}).get(BACKEND_KEY)
+    if backend is None:
+        guardados = collection.get(limit=1, include=["embeddings"])["embeddings"]
+        if guardados is None or len(guardados) == 0:
+            backend = BACKEND_SIN_MARCA
+        else:
+            dimension = len(guardados[0])
+            if dimension not in BACKEND_POR_DIMENSION:
+                raise ValueError(
+                    f"La colección no indica con qué embeddings se construyó (vectores de {dimension} "
+                    "dimensiones): reconstrúyela con python preprocess_embeddings.py --full"
+                )
+            backend = BACKEND_POR_DIMENSION[dimension]
+    return normalizar_backend(backend)
+
+
+def marcar_backend(collection, backend):
+    """Guarda el backend en una colección que no lo tiene (get_or_create_collection ignora
+    metadata= si la colección ya existe). Chroma no deja reenviar "hnsw:*" en modify()"""
+    metadata = collection.metadata or {}
+    if metadata.get(BACKEND_KEY) == backend:
+        return
+    metadata = {k: v for k, v in metadata.items() if not k.startswith("hnsw:")}
+    collection.modify(metadata={**metadata, BACKEND_KEY: backend})
+
+
+# ==================== CACHÉ EN DISCO ====================
+
+def hash_texto(text):
+    return hashlib.sha256(text.encode("utf-8")).hexdigest()
+
+
+class EmbeddingCache:
+    """Vectores ya calculados en SQLite, por backend y SHA-256 del texto"""
+
+    def __init__(self, path=CACHE_FILE):
+        Path(path).parent.mkdir(parents=True, exist_ok=True)
+        self._db = sqlite3.connect(path, check_same_thread=False)
+        self._db.execute("PRAGMA journal_mode=WAL")
+        self._db.execute(
+            "CREATE TABLE IF NOT EXISTS embeddings ("
+            "backend TEXT NOT NULL, hash TEXT NOT NULL, vector BLOB NOT NULL, "
+            "PRIMARY KEY (backend, hash))"
+        )
+        self._db.commit()
+        self._lock = threading.Lock()
+
+    def get_many(self, backend, hashes, chunk=500):
+        """{hash: vector} de los hashes que ya están en la caché"""
+        hashes = list(hashes)
+        encontrados = {}
+        with self._lock:
+            for i in range(0, len(hashes), chunk):
+                parte = hashes[i:i + chunk]
+                filas = self._db.execute(
+                    f"SELECT hash, vector FROM embeddings WHERE backend = ? AND hash IN ({','.join('?' * len(parte))})",
+                    [backend, *parte],
+                )
+                for h, blob in filas:
+                    encontrados[h] = np.frombuffer(blob, dtype=np.float32)
+        return encontrados
+
+    def put_many(self, backend, items):
+        """Guarda [(hash, vector)]"""
+        with self._lock:
+            self._db.executemany(
+                "INSERT OR REPLACE INTO embeddings (backend, hash, vector) VALUES (?, ?, ?)",
+                [(backend, h, np.asarray(v, dtype=np.float32).tobytes()) for h, v in items],
+            )
+            self._db.commit()
+
+    def __len__(self):
+        with self._lock:
+            return self._db.execute("SELECT COUNT(*) FROM embeddings").fetchone()[0]
+
+
+class CachedEmbedder:
+    """Backend + caché: cada texto distinto se calcula una sola vez por backend"""
+
+    def __init__(self, backend, cache=None):
+        self.backend = backend
+        self.name = backend.name
+        self.cache = cache if cache is not None else EmbeddingCache()
+        self.hits = 0
+        self.misses = 0
+
+    def embed(self, texts, on_progress=None):
+        """Vectores de texts (en el mismo orden); solo se calculan los que faltan en la caché.
+        on_progress(hechos, total) cuenta todos los textos, también los que salen de la caché"""
+        hashes = [hash_texto(t) for t in texts]
+        vectores = self.cache.get_many(self.name, set(hashes))
+
+        faltan = {}   # hash -> texto, sin repetir textos idénticos dentro del lote
+        for h, text in zip(hashes, texts):
+            if h not in vectores:
+                faltan.setdefault(h, text)
+        en_cache = sum(1 for h in hashes if h in vectores)
+        if faltan:
+            avance = None
+            if on_progress:
+                on_progress(en_cache, len(texts))
+                avance = lambda hechos, _: on_progress(en_cache + hechos, len(texts))
+            nuevos = dict(zip(faltan, self.backend.embed(list(faltan.values()), on_progress=avance)))
+            self.cache.put_many(self.name, nuevos.items())
+            vectores.update(nuevos)
+        if on_progress:
+            on_progress(len(texts), len(texts))
+
+        self.misses += len(faltan)
+        self.hits += len(texts) - len(faltan)
+        return [vectores[h] for h in hashes]
+
+    def embed_query(self, text):
+        """Vector de una pregunta (sin pasar por la caché: las preguntas casi no se repiten)"""
+        return self.backend.embed([text])[0]
@@ -0,0 +1,196 @@
+"""
+Cliente asíncrono de Groq compartido por todas las sesiones de Streamlit.
+Un event loop en un hilo de fondo mantiene un solo pool de conexiones httpx
+(keep-alive) y los scripts lo usan con métodos síncronos. Todas las llamadas
+pasan por el planificador de rate_limit.py; opcionalmente se lanza un segundo
+intento (hedging) si el primero tarda en dar el primer token.
+"""
+
+import asyncio
+import queue
+import threading
+
+import httpx
+from groq import AsyncGroq, APIConnectionError, InternalServerError, RateLimitError
+
+from chunking import contar_tokens
+from rate_limit import RateLimiter, RPM, TPM, PRIORIDAD_CHAT, MAX_REINTENTOS, backoff, segundos
+
+TIMEOUT = 60            # segundos de lectura por petición
+CONNECT_TIMEOUT = 5     # segundos para abrir la conexión
+MAX_CONNECTIONS = 20    # conexiones simultáneas a la API
+KEEPALIVE = 60          # segundos que una conexión ociosa queda abierta
+
+_FIN = object()
+
+
+def estimar_tokens(kwargs):
+    """Tokens que la petición descuenta del cupo por minuto: prompt + respuesta máxima"""
+    prompt = sum(contar_tokens(m.get("content") or "") for m in kwargs.get("messages", []))
+    return prompt + kwargs.get("max_tokens", 1024)
+
+
+class AsyncGroqClient:
+    """AsyncGroq sobre un loop propio, con puente síncrono para Streamlit"""
+
+    def __init__(self, api_key, timeout=TIMEOUT, connect_timeout=CONNECT_TIMEOUT,
+                 max_connections=MAX_CONNECTIONS, hedge_after=None, rpm=RPM, tpm=TPM):
+        # hedge_after: segundos sin primer token antes del segundo intento (None = sin hedging)
+        self.hedge_after = hedge_after
+        self.hedges = 0         # segundos intentos lanzados
+        self.hedge_wins = 0     # veces que el segundo intento respondió primero
+
+        self.loop = asyncio.new_event_loop()
+        self._thread = threading.Thread(target=self.loop.run_forever, name="groq-loop", daemon=True)
+        self._thread.start()
+
+        self.http = httpx.AsyncClient(
+            timeout=httpx.Timeout(timeout, connect=connect_timeout),
+            limits=httpx.Limits(
+                max_connections=max_connections,
+                max_keepalive_connections=max_connections,
+                keepalive_expiry=KEEPALIVE,
+            ),
+        )
+        # Los reintentos los hace _llamar, para que también pasen por el planificador
+        self.client = AsyncGroq(api_key=api_key, http_client=self.http, max_retries=0)
+        self.limiter = RateLimiter(rpm, tpm)
+
+    def submit(self, coro):
+        """Programa una corrutina en el loop del cliente (concurrent.futures.Future)"""
+        return asyncio.run_coroutine_threadsafe(coro, self.loop)
+
+    def complete(self, prioridad=PRIORIDAD_CHAT, **kwargs):
+        """chat.completions.create sin streaming; bloquea hasta tener la respuesta"""
+        return self.submit(self.acomplete(prioridad, **kwargs)).result()
+
+    async def acomplete(self, prioridad=PRIORIDAD_CHAT, **kwargs):
+        return await self._hedged(lambda: self._llamar(kwargs, prioridad), estimar_tokens(kwargs))
+
+    def stream(self, prioridad=PRIORIDAD_CHAT, **kwargs):
+        """chat.completions.create con stream=True como iterador síncrono de chunks.
+
+        Espera el primer chunk antes de volver, así los errores de la petición
+        (clave inválida, límite de tasa) se lanzan aquí y no al iterar.
+        """
+        salida = queue.Queue()
+        futuro = self.submit(self._emitir(kwargs, prioridad, salida))
+        primero = salida.get()
+        if isinstance(primero, Exception):
+            raise primero
+        return self._leer(primero, salida, futuro)
+
+    def close(self):
+        self.submit(self.http.aclose()).result()
+        self.loop.call_soon_threadsafe(self.loop.stop)
+
+    # ---------- internos (corren en el loop) ----------
+
+    @staticmethod
+    def _leer(primero, salida, futuro):
+        try:
+            item = primero
+            while item is not _FIN:
+                if isinstance(item, Exception):
+                    raise item
+                yield item
+                item = salida.get()
+        finally:
+            # Si quien lee deja de iterar (p. ej. un rerun de Streamlit), cerrar el stream
+            futuro.cancel()
+
+    async def _llamar(self, kwargs, prioridad):
+        """Una petición a través del planificador, con reintentos ante 429 y errores de red"""
+        tokens = estimar_tokens(kwargs)
+        for intento in range(MAX_REINTENTOS + 1):
+            turno = await self.limiter.adquirir(tokens, prioridad)
+            headers = None
+            try:
+                respuesta = await self.client.chat.completions.with_raw_response.create(**kwargs)
+                headers = respuesta.headers
+                return await respuesta.parse()
+            except RateLimitError as e:
+                # Límite alcanzado (quizás por otro proceso): nadie sale hasta que el servidor lo indique
+                headers = e.response.headers
+                error = e
+                espera = segundos(headers.get("retry-after")) or backoff(intento)
+                self.limiter.pausar(espera)
+            except (APIConnectionError, InternalServerError) as e:
+                error = e
+                espera = backoff(intento)
+            finally:
+                self.limiter.liberar(turno, headers)
+
+            if intento == MAX_REINTENTOS:
+                raise error
+            self.limiter.reintentos += 1
+            print(f"⏳ Groq: {type(error).__name__}, reintento {intento + 1} en {espera:.1f}s")
+            if not isinstance(error, RateLimitError):
+                await asyncio.sleep(espera)
+
+    async def _abrir_stream(self, kwargs, prioridad):
+        """Abre un stream y espera su primer chunk: (stream, iterador, primer chunk o _FIN)"""
+        stream = await self._llamar({**kwargs, "stream": True}, prioridad)
+        iterador = stream.__aiter__()
+        try:
+            primero = await iterador.__anext__()
+        except StopAsyncIteration:
+            primero = _FIN
+        except BaseException:
+            await stream.close()
+            raise
+        return stream, iterador, primero
+
+    async def _emitir(self, kwargs, prioridad, salida):
+        """Pasa los chunks del stream ganador a la cola que lee el hilo de Streamlit"""
+        try:
+            stream, iterador, primero = await self._hedged(
+                lambda: self._abrir_stream(kwargs, prioridad), estimar_tokens(kwargs),
+                descartar=lambda r: r[0].close(),
+            )
+            try:
+                salida.put(primero)
+                if primero is not _FIN:
+                    async for chunk in iterador:
+                        salida.put(chunk)
+            finally:
+                await stream.close()
+        except Exception as e:
+            salida.put(e)
+        finally:
+            salida.put(_FIN)
+
+    async def _hedged(self, intento, tokens, descartar=None):
+        """Corre intento(); si no termina en hedge_after segundos lanza otro y se queda con el primero que responda"""
+        primero = asyncio.ensure_future(intento())
+        if not self.hedge_after:
+            return await primero
+
+        listos, _ = await asyncio.wait({primero}, timeout=self.hedge_after)
+        if listos or not self.limiter.libre(tokens):
+            # Si la demora es por falta de cupo, otro intento solo empeoraría la cola
+            return await primero
+
+        self.hedges += 1
+        segundo = asyncio.ensure_future(intento())
+        pendientes = {primero, segundo}
+        error = None
+        while pendientes:
+            listos, pendientes = await asyncio.wait(pendientes, return_when=asyncio.FIRST_COMPLETED)
+            for tarea in listos:
+                if tarea.exception() is not None:
+                    error = tarea.exception()
+                    continue
+                if tarea is segundo:
+                    self.hedge_wins += 1
+                # Cancelar el otro intento (o liberar su respuesta si también llegó)
+                for otra in {primero, segundo} - {tarea}:
+                    otra.cancel()
+                    if descartar is not None:
+                        otra.add_done_callback(lambda t: self._descartar(t, descartar))
+                return tarea.result()
+        raise error
+
+    def _descartar(self, tarea, descartar):
+        if not tarea.cancelled() and tarea.exception() is None:
+            asyncio.ensure_future(descartar(tarea.result()))
@@ -0,0 +1,145 @@
+"""
+Extractor local de palabras clave en español.
+Sustituye la llamada al LLM en RAGSystem.search: corre en memoria,
+sin red, y pondera los términos con IDF calculado sobre el corpus indexado.
+"""
+
+import json
+import math
+import re
+import unicodedata
+from pathlib import Path
+
+# Archivo con las frecuencias de documento, se guarda junto a chroma_db/
+IDF_FILE = "./chroma_db/keywords_idf.json"
+
+# Stopwords en español (ya sin acentos, igual que los tokens normalizados)
+STOPWORDS = {
+    "a", "al", "algo", "algun", "alguna", "algunas", "alguno", "algunos", "ante",
+    "antes", "aqui", "asi", "aun", "bajo", "bien", "cada", "casi", "como", "con",
+    "contra", "cual", "cuales", "cualquier", "cuando", "cuanto", "cuantos", "de",
+    "del", "desde", "donde", "dos", "durante", "e", "el", "ella", "ellas", "ellos",
+    "en", "entre", "era", "eran", "es", "esa", "esas", "ese", "eso", "esos", "esta",
+    "estaba", "estan", "estar", "estas", "este", "esto", "estos", "fue", "fueron",
+    "ha", "habia", "han", "hasta", "hay", "la", "las", "le", "les", "lo", "los",
+    "mas", "me", "mi", "mis", "mucho", "muy", "nada", "ni", "no", "nos", "nosotros",
+    "o", "otra", "otras", "otro", "otros", "para", "pero", "poco", "por", "porque",
+    "que", "quien", "quienes", "se", "sea", "segun", "ser", "si", "sido", "sin",
+    "sino", "sobre", "son", "su", "sus", "tambien", "tan", "tanto", "te", "tiene",
+    "tienen", "todo", "todos", "tu", "tus", "u", "un", "una", "unas", "uno", "unos",
+    "y", "ya", "yo",
+    # Palabras típicas de preguntas que no aportan al tema
+    "explicame", "explica", "explicar", "dime", "describe", "define", "menciona",
+    "significa", "significado", "hablame", "favor", "puedes", "podrias",
+    "quiero", "saber", "ejemplo", "ejemplos", "diferencia", "diferencias",
+    # Inglés básico (parte del corpus está en inglés)
+    "the", "of", "and", "to", "in", "is", "what", "on", "for", "an", "are", "how",
+}
+
+_TOKEN_RE = re.compile(r"[a-z0-9]+")
+
+
+def normalizar(texto):
+    """Minúsculas y sin acentos (ñ -> n, á -> a, ...)"""
+    texto = unicodedata.normalize("NFKD", texto.lower())
+    return "".join(c for c in texto if not unicodedata.combining(c))
+
+
+def tokenizar(texto):
+    """Divide el texto normalizado en tokens alfanuméricos"""
+    return _TOKEN_RE.findall(normalizar(texto))
+
+
+def normalizar_texto(texto):
+    """Texto normalizado con tokens separados por espacios (con bordes) para buscar frases completas"""
+    return " " + " ".join(tokenizar(texto)) + " "
+
+
+def contar_coincidencias(keywords, texto_normalizado):
+    """Cuenta cuántas keywords (ya normalizadas) aparecen como palabra/frase completa"""
+    return sum(1 for kw in keywords if f" {kw} " in texto_normalizado)
+
+
+class KeywordExtractor:
+    """Extrae palabras clave y frases (n-gramas) ponderadas por IDF"""
+
+    def __init__(self, df=None, n_docs=0, max_df_ratio=0.5):
+        self.df = df or {}
+        self.n_docs = n_docs
+        self.max_df_ratio = max_df_ratio
+
+    @classmethod
+    def from_documents(cls, documents, **kwargs):
+        """Calcula las frecuencias de documento a partir de los chunks indexados"""
+        df = {}
+        n_docs = 0
+        for doc in documents:
+            n_docs += 1
+            for token in set(tokenizar(doc)):
+                df[token] = df.get(token, 0) + 1
+        return cls(df, n_docs, **kwargs)
+
+    @classmethod
+    def from_index(cls, index, **kwargs):
+        """Toma las frecuencias de documento de un BM25Index (mismos chunks, sin releer textos)"""
+        df = {term: int(index.offsets[t + 1] - index.offsets[t]) for term, t in index.vocab.items()}
+        return cls(df, index.n_docs, **kwargs)
+
+    @classmethod
+    def load(cls, path=IDF_FILE, **kwargs):
+        """Carga las frecuencias guardadas por preprocess_embeddings.py"""
+        with open(path, "r", encoding="utf-8") as f:
+            data = json.load(f)
+        return cls(data["df"], data["n_docs"], **kwargs)
+
+    def save(self, path=IDF_FILE):
+        """Guarda las frecuencias de documento en JSON"""
+        Path(path).parent.mkdir(parents=True, exist_ok=True)
+        with open(path, "w", encoding="utf-8") as f:
+            json.dump({"n_docs": self.n_docs, "df": self.df}, f, ensure_ascii=False)
+
+    def idf(self, token):
+        """IDF suavizado; los términos fuera del corpus reciben el peso máximo"""
+        return math.log((self.n_docs + 1) / (self.df.get(token, 0) + 1)) + 1
+
+    def _es_candidato(self, token):
+        if token in STOPWORDS or len(token) < 2:
+            return False
+        # Términos presentes en más de la mitad del corpus no discriminan
+        if self.n_docs and self.df.get(token, 0) / self.n_docs > self.max_df_ratio:
+            return False
+        return True
+
+    def extract_weighted(self, query, max_keywords=6, max_ngram=3):
+        """Devuelve [(keyword, peso)] ordenado de mayor a menor peso"""
+        tokens = tokenizar(query)
+
+        # Secuencias de palabras de contenido (las stopwords cortan las frases)
+        runs = []
+        actual = []
+        for token in tokens:
+            if self._es_candidato(token):
+                actual.append(token)
+            elif actual:
+                runs.append(actual)
+                actual = []
+        if actual:
+            runs.append(actual)
+
+        scores = {}
+        for run in runs:
+            for n in range(1, max_ngram + 1):
+                for i in range(len(run) - n + 1):
+                    gram = run[i:i + n]
+                    # Las frases pesan un poco más que la media de sus palabras
+                    peso = sum(self.idf(t) for t in gram) / n * (1 + 0.25 * (n - 1))
+                    kw = " ".join(gram)
+                    if peso > scores.get(kw, 0):
+                        scores[kw] = peso
+
+        ranked = sorted(scores.items(), key=lambda x: -x[1])
+        return ranked[:max_keywords]
+
+    def extract(self, query, max_keywords=6, max_ngram=3):
+        """Devuelve solo la lista de keywords normalizadas"""
+        return [kw for kw, _ in self.extract_weighted(query, max_keywords, max_ngram)]
@@ -31,12 +31,26 @@ try:
 except Exception as e:
     print(f"⚠️  Advertencia al cargar modelo: {str(e)[:50]}\n")
 
+def imagen_redimensionada(ruta_imagen, ancho, alto):
+    """Decodifica, reduce y codifica como JPEG en memoria (sin archivo temporal)"""
+    with Image.open(ruta_imagen) as img:
+        # En JPEG, draft decodifica directo a una escala reducida
+        img.draft("RGB", (ancho, alto))
+        img.thumbnail((ancho, alto), Image.Resampling.LANCZOS)
+        if img.mode not in ("RGB", "L"):
+            img = img.convert("RGB")
+        buffer = io.BytesIO()
+        img.save(buffer, "JPEG", quality=90)
+    return buffer.getvalue()
+
 def redimensionar_imagen(ruta_imagen):
     """Redimensiona imagen a resolución válida (Gundam: n×640×640 + 1×1024×1024)
-    Mínimo: 640×640, Máximo: 1024×1024"""
+    Mínimo: 640×640, Máximo: 1024×1024
+    Devuelve la ruta original si no hace falta, o los bytes JPEG redimensionados"""
     try:
-        img = Image.open(ruta_imagen)
-        original_w, original_h = img.size
+        # Image.open sólo lee la cabecera: el tamaño sale sin decodificar la imagen
+        with Image.open(ruta_imagen) as img:
+            original_w, original_h = img.size
         
         # Si ya está dentro de límites válidos (640-1024), no redimensionar
         if 640 <= original_w <= 1024 and 640 <= original_h <= 1024:
@@ -63,13 +77,9 @@ def redimensionar_imagen(ruta_imagen):
         nuevo_w = max(32, (nuevo_w // 32) * 32)
         nuevo_h = max(32, (nuevo_h // 32) * 32)
         
-        img.thumbnail((nuevo_w, nuevo_h), Image.Resampling.LANCZOS)
-        
-        # Guardar en archivo temporal
-        temp_path = os.path.join(CARPETA_TEMPORAL, "temp_resized.jpg")
-        img.save(temp_path, "JPEG", quality=90)
+        imagen_jpeg = imagen_redimensionada(ruta_imagen, nuevo_w, nuevo_h)
         print(f"   🔄 Redimensionada: {original_w}x{original_h} → {nuevo_w}x{nuevo_h}")
-        return temp_path
+        return imagen_jpeg
     except Exception as e:
         pass
     
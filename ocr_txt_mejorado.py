@@ -2,6 +2,9 @@ import ollama
 import os
 import glob
 import time
+import queue
+import threading
+import io
 from PIL import Image
 
 # --- CONFIGURACIÓN ---
@@ -15,6 +18,10 @@ PREFIJOS = ["tratado", "interaccionismo"]  # ← Agregar más si necesario
 
 TIMEOUT = 180  # 3 minutos máximo por imagen
 
+# PIPELINE (mientras el modelo lee una imagen, la siguiente ya está lista)
+HILOS_PREPARACION = 2  # hilos que redimensionan imágenes por adelantado
+OCR_EN_VUELO = 2       # peticiones OCR simultáneas (iniciar Ollama con OLLAMA_NUM_PARALLEL >= este valor)
+
 # Crear carpetas
 for carpeta in [CARPETA_IMAGENES, CARPETA_TEMPORAL, CARPETA_SALIDA]:
     if not os.path.exists(carpeta):
@@ -33,11 +40,25 @@ try:
 except Exception as e:
     print(f"⚠️  Advertencia al cargar modelo: {str(e)[:50]}\n")
 
+def imagen_redimensionada(ruta_imagen, ancho, alto):
+    """Decodifica, reduce y codifica como JPEG en memoria (sin archivo temporal)"""
+    with Image.open(ruta_imagen) as img:
+        # En JPEG, draft decodifica directo a una escala reducida
+        img.draft("RGB", (ancho, alto))
+        img.thumbnail((ancho, alto), Image.Resampling.LANCZOS)
+        if img.mode not in ("RGB", "L"):
+            img = img.convert("RGB")
+        buffer = io.BytesIO()
+        img.save(buffer, "JPEG", quality=90)
+    return buffer.getvalue()
+
 def redimensionar_imagen(ruta_imagen):
-    """Redimensiona imagen a resolución válida (Gundam: n×640×640 + 1×1024×1024)"""
+    """Redimensiona imagen a resolución válida (Gundam: n×640×640 + 1×1024×1024)
+    Devuelve la ruta original si no hace falta, o los bytes JPEG redimensionados"""
     try:
-        img = Image.open(ruta_imagen)
-        original_w, original_h = img.size
+        # Image.open sólo lee la cabecera: el tamaño sale sin decodificar la imagen
+        with Image.open(ruta_imagen) as img:
+            original_w, original_h = img.size
         
         if 640 <= original_w <= 1024 and 640 <= original_h <= 1024:
             return ruta_imagen
@@ -59,18 +80,133 @@ def redimensionar_imagen(ruta_imagen):
         nuevo_w = max(32, (nuevo_w // 32) * 32)
         nuevo_h = max(32, (nuevo_h // 32) * 32)
         
-        img.thumbnail((nuevo_w, nuevo_h), Image.Resampling.LANCZOS)
-        
-        temp_path = os.path.join(CARPETA_TEMPORAL, "temp_resized.jpg")
-        img.save(temp_path, "JPEG", quality=90)
-        print(f"   🔄 Redimensionada: {original_w}x{original_h} → {nuevo_w}x{nuevo_h}")
-        return temp_path
+        return imagen_redimensionada(ruta_imagen, nuevo_w, nuevo_h)
     except Exception as e:
         pass
     
     return ruta_imagen
 
 
+# ============ PIPELINE DE OCR ============
+cliente = ollama.Client(timeout=TIMEOUT)
+latencias = []    # segundos de OCR por imagen, de todos los temas
+tiempo_ocr = 0.0  # tiempo total de FASE 1 con imágenes pendientes
+
+def ocr_imagen(img_procesada):
+    """Manda la imagen al modelo y devuelve el texto extraído"""
+    resp = cliente.chat(
+        model=MODELO,
+        messages=[{
+            'role': 'user',
+            'content': 'Extract the text in the image.',
+            'images': [img_procesada]
+        }],
+        stream=False
+    )
+    return resp['message']['content'].strip()
+
+def guardar_txt(txt_file, texto):
+    """Escritura atómica: un TXT a medias nunca cuenta como 'ya procesada'"""
+    temporal = txt_file + ".tmp"
+    with open(temporal, "w", encoding="utf-8") as f:
+        f.write(texto)
+    os.replace(temporal, txt_file)
+
+def procesar_imagenes(imagenes):
+    """
+    FASE 1 en pipeline: HILOS_PREPARACION redimensionan por adelantado,
+    OCR_EN_VUELO hilos hacen las peticiones y este hilo escribe los TXT.
+    Devuelve (procesadas, saltadas, errores)
+    """
+    global tiempo_ocr
+    total = len(imagenes)
+    saltadas = 0
+    por_preparar = queue.Queue()
+    
+    for idx, img in enumerate(imagenes, 1):
+        nombre = os.path.basename(img)
+        nombre_base = os.path.splitext(nombre)[0]
+        txt_file = os.path.join(CARPETA_TEMPORAL, f"{nombre_base}.txt")
+        
+        if os.path.exists(txt_file):
+            print(f"[{idx:02d}/{total}] ⏭️  {nombre:<40} (ya procesada)")
+            saltadas += 1
+        else:
+            por_preparar.put((idx, img, txt_file))
+    
+    pendientes = por_preparar.qsize()
+    if pendientes == 0:
+        return 0, saltadas, 0
+    
+    # Cola acotada: la preparación no se adelanta más de lo necesario
+    preparadas = queue.Queue(maxsize=OCR_EN_VUELO * 2)
+    resultados = queue.Queue()
+    
+    def preparar():
+        while True:
+            try:
+                idx, img, txt_file = por_preparar.get_nowait()
+            except queue.Empty:
+                return
+            preparadas.put((idx, img, txt_file, redimensionar_imagen(img)))
+    
+    def reconocer():
+        while True:
+            item = preparadas.get()
+            if item is None:
+                return
+            idx, img, txt_file, img_procesada = item
+            inicio = time.time()
+            try:
+                texto, error = ocr_imagen(img_procesada), None
+            except Exception as e:
+                texto, error = "", str(e)[:40]
+            resultados.put((idx, img, txt_file, texto, error, time.time() - inicio))
+    
+    hilos = [threading.Thread(target=preparar, daemon=True) for _ in range(HILOS_PREPARACION)]
+    hilos += [threading.Thread(target=reconocer, daemon=True) for _ in range(OCR_EN_VUELO)]
+    for hilo in hilos:
+        hilo.start()
+    
+    procesadas = 0
+    errores = 0
+    inicio_fase = time.time()
+    
+    # Escritor: los resultados llegan en el orden en que terminan
+    for _ in range(pendientes):
+        idx, img, txt_file, texto, error, tiempo_proc = resultados.get()
+        linea = f"[{idx:02d}/{total}] 🔄 {os.path.basename(img):<40}"
+        
+        if error:
+            if "timeout" in error.lower():
+                print(f"{linea} ⏱️  TIMEOUT - SALTADA")
+            else:
+                print(f"{linea} ❌ {error}")
+            errores += 1
+        elif texto and len(texto) > 5:
+            guardar_txt(txt_file, texto)
+            latencias.append(tiempo_proc)
+            print(f"{linea} ✅ ({tiempo_proc:.1f}s, {len(texto)} chars)")
+            procesadas += 1
+        else:
+            print(f"{linea} ⚠️  (texto vacío)")
+            errores += 1
+    
+    tiempo_ocr += time.time() - inicio_fase
+    
+    for _ in range(OCR_EN_VUELO):
+        preparadas.put(None)
+    for hilo in hilos:
+        hilo.join()
+    
+    return procesadas, saltadas, errores
+
+def percentil(valores, p):
+    """Percentil p (0-100) por rango más cercano"""
+    ordenados = sorted(valores)
+    return ordenados[min(len(ordenados) - 1, round(p / 100 * (len(ordenados) - 1)))]
+
+
 # ============ PROCESAR CADA PREFIJO POR SEPARADO ============
 print("=" * 80)
 print("PROCESANDO MÚLTIPLES TEMAS")
@@ -105,57 +241,7 @@ for PREFIJO in PREFIJOS:
     # ============ FASE 1: PROCESAR IMÁGENES ============
     print("FASE 1: Procesando imágenes...")
     
-    procesadas = 0
-    saltadas = 0
-    errores = 0
-    
-    for idx, img in enumerate(imagenes, 1):
-        nombre = os.path.basename(img)
-        nombre_base = os.path.splitext(nombre)[0]
-        txt_file = os.path.join(CARPETA_TEMPORAL, f"{nombre_base}.txt")
-        
-        if os.path.exists(txt_file):
-            print(f"[{idx:02d}/{len(imagenes)}] ⏭️  {nombre:<40} (ya procesada)")
-            saltadas += 1
-            continue
-        
-        print(f"[{idx:02d}/{len(imagenes)}] 🔄 {nombre:<40}", end="", flush=True)
-        
-        try:
-            inicio = time.time()
-            img_procesada = redimensionar_imagen(img)
-            
-            resp = ollama.chat(
-                model=MODELO,
-                messages=[{
-                    'role': 'user',
-                    'content': 'Extract the text in the image.',
-                    'images': [img_procesada]
-                }],
-                stream=False
-            )
-            
-            tiempo_proc = time.time() - inicio
-            texto = resp['message']['content'].strip()
-            
-            if texto and len(texto) > 5:
-                with open(txt_file, "w", encoding="utf-8") as f:
-                    f.write(texto)
-                
-                chars = len(texto)
-                print(f" ✅ ({tiempo_proc:.1f}s, {chars} chars)")
-                procesadas += 1
-            else:
-                print(f" ⚠️  (texto vacío)")
-                errores += 1
-        
-        except Exception as e:
-            error_msg = str(e)[:40]
-            if "timeout" in error_msg.lower():
-                print(f" ⏱️  TIMEOUT - SALTADA")
-            else:
-                print(f" ❌ {error_msg}")
-            errores += 1
+    procesadas, saltadas, errores = procesar_imagenes(imagenes)
     
     print(f"\nResumen FASE 1:")
     print(f"  ✅ Procesadas:  {procesadas}")
@@ -257,57 +343,7 @@ else:
     # ============ FASE 1: PROCESAR IMÁGENES ============
     print("FASE 1: Procesando imágenes...")
     
-    procesadas = 0
-    saltadas = 0
-    errores = 0
-    
-    for idx, img in enumerate(imagenes_sin_categoria, 1):
-        nombre = os.path.basename(img)
-        nombre_base = os.path.splitext(nombre)[0]
-        txt_file = os.path.join(CARPETA_TEMPORAL, f"{nombre_base}.txt")
-        
-        if os.path.exists(txt_file):
-            print(f"[{idx:02d}/{len(imagenes_sin_categoria)}] ⏭️  {nombre:<40} (ya procesada)")
-            saltadas += 1
-            continue
-        
-        print(f"[{idx:02d}/{len(imagenes_sin_categoria)}] 🔄 {nombre:<40}", end="", flush=True)
-        
-        try:
-            inicio = time.time()
-            img_procesada = redimensionar_imagen(img)
-            
-            resp = ollama.chat(
-                model=MODELO,
-                messages=[{
-                    'role': 'user',
-                    'content': 'Extract the text in the image.',
-                    'images': [img_procesada]
-                }],
-                stream=False
-            )
-            
-            tiempo_proc = time.time() - inicio
-            texto = resp['message']['content'].strip()
-            
-            if texto and len(texto) > 5:
-                with open(txt_file, "w", encoding="utf-8") as f:
-                    f.write(texto)
-                
-                chars = len(texto)
-                print(f" ✅ ({tiempo_proc:.1f}s, {chars} chars)")
-                procesadas += 1
-            else:
-                print(f" ⚠️  (texto vacío)")
-                errores += 1
-        
-        except Exception as e:
-            error_msg = str(e)[:40]
-            if "timeout" in error_msg.lower():
-                print(f" ⏱️  TIMEOUT - SALTADA")
-            else:
-                print(f" ❌ {error_msg}")
-            errores += 1
+    procesadas, saltadas, errores = procesar_imagenes(imagenes_sin_categoria)
     
     print(f"\nResumen FASE 1:")
     print(f"  ✅ Procesadas:  {procesadas}")
@@ -384,3 +420,10 @@ else:
 print("\n" + "=" * 80)
 print("✅ PROCESO COMPLETADO - TODOS LOS TEMAS PROCESADOS")
 print("=" * 80)
+
+if latencias:
+    print(f"\n⏱️  Latencia OCR por imagen: p50 {percentil(latencias, 50):.1f}s | "
+          f"p90 {percentil(latencias, 90):.1f}s | p99 {percentil(latencias, 99):.1f}s | "
+          f"máx {max(latencias):.1f}s")
+    print(f"⚡ Throughput: {len(latencias) / (tiempo_ocr / 60):.1f} imágenes/min "
+          f"({OCR_EN_VUELO} peticiones en vuelo)")
@@ -1,14 +1,53 @@
 import os
+import time
+import argparse
+import shutil
 from pathlib import Path
+from concurrent.futures import ProcessPoolExecutor, as_completed
 import pypdf
 
-def convertir_pdfs_a_txt(carpeta_origen="./documentos", carpeta_destino="./doc_convertidos"):
+# PDFs con más páginas que esto se reparten en rangos entre varios procesos
+PAGINAS_POR_TAREA = 40
+
+def extraer_paginas(pdf_path, inicio, fin, destino):
+    """
+    Extrae las páginas [inicio, fin) de un PDF y las escribe directo al archivo destino
+    
+    Returns:
+        Número de páginas escritas
+    """
+    pdf_reader = pypdf.PdfReader(str(pdf_path))
+    
+    with open(destino, 'w', encoding='utf-8') as file:
+        for page_num in range(inicio, fin):
+            file.write(f"\n--- PÁGINA {page_num + 1} ---\n")
+            file.write((pdf_reader.pages[page_num].extract_text() or "") + "\n")
+    
+    return fin - inicio
+
+def necesita_conversion(pdf_path, txt_path):
+    """El TXT falta o es más viejo que el PDF"""
+    return not txt_path.exists() or txt_path.stat().st_mtime < pdf_path.stat().st_mtime
+
+def unir_partes(partes, txt_path):
+    """Concatena los archivos parciales en orden y los elimina"""
+    temporal = txt_path.with_name(txt_path.name + ".tmp")
+    with open(temporal, 'w', encoding='utf-8') as salida:
+        for parte in partes:
+            with open(parte, 'r', encoding='utf-8') as entrada:
+                shutil.copyfileobj(entrada, salida)
+            os.remove(parte)
+    os.replace(temporal, txt_path)
+
+def convertir_pdfs_a_txt(carpeta_origen="./documentos", carpeta_destino="./doc_convertidos", workers=None, forzar=False):
     """
-    Convierte todos los PDFs de una carpeta a TXT
+    Convierte todos los PDFs de una carpeta a TXT en paralelo
     
     Args:
         carpeta_origen: Carpeta donde están los PDFs
         carpeta_destino: Carpeta donde se guardarán los TXT
+        workers: Procesos en paralelo (por defecto, uno por núcleo)
+        forzar: Convertir aunque el TXT sea más reciente que el PDF
     """
     
     # Crear carpeta destino si no existe
@@ -24,42 +63,90 @@ def convertir_pdfs_a_txt(carpeta_origen="./documentos", carpeta_destino="./doc_c
     
     print(f"📄 Se encontraron {len(pdfs)} archivos PDF\n")
     
-    for idx, pdf_path in enumerate(pdfs, 1):
-        print(f"[{idx}/{len(pdfs)}] Convirtiendo: {pdf_path.name}...")
+    # Armar tareas: un PDF completo o un rango de páginas por proceso
+    tareas = []     # (pdf_path, inicio, fin, archivo parcial)
+    pendientes = {} # pdf_path -> (txt_path, [archivos parciales])
+    saltados = 0
+    
+    for pdf_path in pdfs:
+        txt_path = Path(carpeta_destino) / (pdf_path.stem + ".txt")  # Usa el nombre del PDF sin extensión
+        
+        if not forzar and not necesita_conversion(pdf_path, txt_path):
+            print(f"   ⏭️  {pdf_path.name} (TXT al día)")
+            saltados += 1
+            continue
         
         try:
-            # Leer PDF
-            with open(pdf_path, 'rb') as file:
-                pdf_reader = pypdf.PdfReader(file)
-                texto = ""
-                
-                # Extraer texto de todas las páginas
-                for page_num, page in enumerate(pdf_reader.pages, 1):
-                    texto += f"\n--- PÁGINA {page_num} ---\n"
-                    texto += page.extract_text() + "\n"
+            total_paginas = len(pypdf.PdfReader(str(pdf_path)).pages)
+        except Exception as e:
+            print(f"   ❌ {pdf_path.name}: {e}")
+            continue
+        
+        partes = []
+        for inicio in range(0, max(total_paginas, 1), PAGINAS_POR_TAREA):
+            fin = min(inicio + PAGINAS_POR_TAREA, total_paginas)
+            parte = txt_path.with_name(f"{txt_path.name}.part{len(partes)}")
+            partes.append(parte)
+            tareas.append((pdf_path, inicio, fin, parte))
+        pendientes[pdf_path] = (txt_path, partes)
+    
+    if not tareas:
+        print(f"\n✨ Todos los TXT están al día ({saltados} saltados)")
+        return
+    
+    # Los rangos más grandes primero para repartir mejor la carga
+    tareas.sort(key=lambda t: t[2] - t[1], reverse=True)
+    
+    inicio_total = time.perf_counter()
+    paginas_total = 0
+    partes_listas = {pdf_path: 0 for pdf_path in pendientes}
+    errores = set()
+    
+    with ProcessPoolExecutor(max_workers=workers) as pool:
+        futuros = {pool.submit(extraer_paginas, *tarea): tarea for tarea in tareas}
+        
+        for futuro in as_completed(futuros):
+            pdf_path = futuros[futuro][0]
+            txt_path, partes = pendientes[pdf_path]
             
-            # Guardar como TXT
-            txt_filename = pdf_path.stem + ".txt"  # Usa el nombre del PDF sin extensión
-            txt_path = Path(carpeta_destino) / txt_filename
+            try:
+                paginas_total += futuro.result()
+            except Exception as e:
+                if pdf_path not in errores:
+                    print(f"   ❌ {pdf_path.name}: {e}")
+                errores.add(pdf_path)
             
-            with open(txt_path, 'w', encoding='utf-8') as file:
-                file.write(texto)
+            partes_listas[pdf_path] += 1
+            if partes_listas[pdf_path] < len(partes):
+                continue
             
-            print(f"   ✅ Guardado en: {txt_path}")
-            print(f"   📊 Páginas: {len(pdf_reader.pages)}\n")
-        
-        except Exception as e:
-            print(f"   ❌ Error: {e}\n")
+            # Todas las partes del PDF terminaron: unir o limpiar
+            if pdf_path in errores:
+                for parte in partes:
+                    if parte.exists():
+                        os.remove(parte)
+                continue
+            
+            unir_partes(partes, txt_path)
+            print(f"   ✅ {pdf_path.name} → {txt_path}")
     
+    duracion = time.perf_counter() - inicio_total
     print(f"\n✨ ¡Conversión completada!")
     print(f"📁 Archivos guardados en: {carpeta_destino}")
+    print(f"📊 {len(pendientes) - len(errores)} convertidos, {saltados} saltados, {len(errores)} con error")
+    print(f"⚡ {paginas_total} páginas en {duracion:.1f}s ({paginas_total / duracion:.1f} páginas/s)")
 
 if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Convierte los PDFs de documentos/ a TXT")
+    parser.add_argument("--workers", type=int, default=None, help="Procesos en paralelo (por defecto, uno por núcleo)")
+    parser.add_argument("--forzar", action="store_true", help="Convertir aunque el TXT esté al día")
+    args = parser.parse_args()
+    
     print("=" * 50)
     print("🔄 CONVERSOR DE PDF A TXT")
     print("=" * 50 + "\n")
     
-    convertir_pdfs_a_txt()
+    convertir_pdfs_a_txt(workers=args.workers, forzar=args.forzar)
     
     print("\n⚠️  PRÓXIMO PASO:")
     print("1. Revisa los archivos en la carpeta 'doc_convertidos'")
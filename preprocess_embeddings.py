@@ -3,9 +3,33 @@ Script para preprocesar embeddings una sola vez.
 Corre esto ANTES de desplegar en Streamlit Cloud.
 """
 
-import chromadb
 from pathlib import Path
+import argparse
 import hashlib
+import json
+import time
+import tracemalloc
+from keywords import KeywordExtractor, IDF_FILE
+from bm25_index import BM25Builder, BM25_DIR
+from chunking import dividir_en_chunks, metadatos_paginas
+from dedup import NearDuplicateIndex
+from caches import normalizar_pregunta
+from contenido_curso import consultas_predefinidas
+from embeddings import (CachedEmbedder, get_backend, backend_de_coleccion, normalizar_backend,
+                        marcar_backend, BACKEND_KEY, EMBEDDING_BACKEND)
+
+# Hash por archivo y por chunk del último indexado (para reindexar solo lo que cambió)
+MANIFEST_FILE = "./chroma_db/manifest.json"
+
+# Resumen del corpus para el panel "Base de Datos" (sin recorrer la colección)
+CORPUS_STATS_FILE = "./chroma_db/corpus_stats.json"
+
+# Embedding y candidatos vectoriales de las consultas fijas (botones del sidebar y quiz)
+PRECOMPUTED_FILE = "./chroma_db/precomputed_queries.json"
+PRECOMPUTED_CANDIDATES = 50   # search() pide n_results * 5 candidatos (10 * 5 en el chat)
+
+# Fragmentos por lote: limita la memoria y respeta el tamaño máximo de lote de ChromaDB
+DEFAULT_BATCH_SIZE = 128
 
 def get_documents_hash(folder_path="./documentos"):
     """Genera un hash de los documentos actuales"""
@@ -28,20 +52,6 @@ def get_documents_hash(folder_path="./documentos"):
         print(f"Error generando hash: {e}")
         return None
 
-def chunk_text(text, chunk_size=1000, overlap=200):
-    """Divide el texto en chunks"""
-    chunks = []
-    start = 0
-    text_length = len(text)
-    
-    while start < text_length:
-        end = start + chunk_size
-        chunk = text[start:end]
-        chunks.append(chunk)
-        start += chunk_size - overlap
-        
-    return chunks
-
 def load_txt(txt_path):
     """Carga texto de un archivo TXT"""
     try:
@@ -51,90 +61,364 @@ def load_txt(txt_path):
         print(f"Error al leer TXT {txt_path}: {e}")
         return None
 
-def preprocess_embeddings(folder_path="./documentos"):
-    """Procesa y guarda embeddings en ChromaDB de forma persistente"""
-    
-    print("🚀 Iniciando preprocesamiento de embeddings...")
-    
-    # Conectar a ChromaDB
-    client = chromadb.PersistentClient(path="./chroma_db")
-    collection_name = "documentos_curso"
+def hash_text(text):
+    """Hash del contenido (no depende de fecha ni nombre)"""
+    return hashlib.sha256(text.encode("utf-8")).hexdigest()
+
+def load_manifest(path=MANIFEST_FILE):
+    """Carga el manifiesto {files: {archivo: {hash, chunks: {id: hash}, duplicates: {id: canónico}}},
+    alt_sources: {id: fuentes}} del último indexado"""
+    try:
+        with open(path, "r", encoding="utf-8") as f:
+            return json.load(f)
+    except FileNotFoundError:
+        return None
+    except Exception as e:
+        print(f"⚠️ Manifiesto ilegible ({e}), se reconstruirá todo")
+        return None
+
+def save_manifest(manifest, path=MANIFEST_FILE):
+    """Guarda el manifiesto junto a chroma_db/"""
+    Path(path).parent.mkdir(parents=True, exist_ok=True)
+    with open(path, "w", encoding="utf-8") as f:
+        json.dump(manifest, f, ensure_ascii=False, indent=1)
+
+def build_corpus_stats(sources, duracion=None):
+    """Resumen del corpus a partir de {archivo: {"chunks": n, "chars": c}}"""
+    sources = {name: s for name, s in sources.items() if s["chunks"]}  # archivos vacíos no cuentan
+    return {
+        "total_chunks": sum(s["chunks"] for s in sources.values()),
+        "total_chars": sum(s["chars"] for s in sources.values()),
+        "sources": dict(sorted(sources.items())),
+        "built_at": time.strftime("%Y-%m-%d %H:%M:%S"),
+        "build_seconds": round(duracion, 1) if duracion is not None else None,
+    }
+
+def save_corpus_stats(stats, path=CORPUS_STATS_FILE):
+    """Guarda el resumen del corpus junto a chroma_db/"""
+    Path(path).parent.mkdir(parents=True, exist_ok=True)
+    with open(path, "w", encoding="utf-8") as f:
+        json.dump(stats, f, ensure_ascii=False, indent=1)
+
+def load_corpus_stats(path=CORPUS_STATS_FILE):
+    """Carga el resumen del corpus; None si no se ha generado"""
+    try:
+        with open(path, "r", encoding="utf-8") as f:
+            return json.load(f)
+    except FileNotFoundError:
+        return None
+    except Exception as e:
+        print(f"⚠️ Resumen del corpus ilegible: {e}")
+        return None
+
+def corpus_stats_from_collection(collection, batch_size=1000):
+    """Calcula el resumen recorriendo los metadatos por páginas (colecciones indexadas sin resumen)"""
+    sources = {}
+    for offset in range(0, collection.count(), batch_size):
+        for m in collection.get(limit=batch_size, offset=offset, include=["metadatas"])["metadatas"]:
+            source = sources.setdefault(m["source"], {"chunks": 0, "chars": 0})
+            source["chunks"] += 1
+    return build_corpus_stats(sources)
+
+def build_precomputed_queries(collection, queries=None, embedder=None, n_candidates=PRECOMPUTED_CANDIDATES):
+    """Embedding, ids y distancias de los candidatos de cada consulta fija, con la
+    clave normalizada de caches.normalizar_pregunta. embedder: el del backend de la colección"""
+    queries = queries or consultas_predefinidas()
+    if embedder is None:
+        embedder = CachedEmbedder(get_backend(backend_de_coleccion(collection)))
+    n_candidates = min(n_candidates, collection.count())
+    if not n_candidates:
+        return {"n_candidates": 0, "queries": {}}
     
-    # Eliminar colección anterior si existe
+    embeddings = [[float(x) for x in e] for e in embedder.embed(queries)]
+    results = collection.query(query_embeddings=embeddings, n_results=n_candidates, include=["distances"])
+    return {
+        "n_candidates": n_candidates,
+        "queries": {
+            normalizar_pregunta(query): {
+                "embedding": embedding,
+                "ids": ids,
+                "distances": [float(d) for d in distances],
+            }
+            for query, embedding, ids, distances in zip(queries, embeddings, results["ids"], results["distances"])
+        },
+    }
+
+def save_precomputed_queries(data, path=PRECOMPUTED_FILE):
+    Path(path).parent.mkdir(parents=True, exist_ok=True)
+    with open(path, "w", encoding="utf-8") as f:
+        json.dump(data, f, ensure_ascii=False)
+
+def load_precomputed_queries(path=PRECOMPUTED_FILE):
+    """Carga las consultas precalculadas; None si no se han generado"""
     try:
-        client.delete_collection(collection_name)
-        print("♻️ Colección anterior eliminada")
-    except:
-        pass
+        with open(path, "r", encoding="utf-8") as f:
+            return json.load(f)
+    except FileNotFoundError:
+        return None
+    except Exception as e:
+        print(f"⚠️ Consultas precalculadas ilegibles: {e}")
+        return None
+
+def iter_batches(iterable, batch_size):
+    """Agrupa un iterable en listas de como máximo batch_size elementos"""
+    batch = []
+    for item in iterable:
+        batch.append(item)
+        if len(batch) >= batch_size:
+            yield batch
+            batch = []
+    if batch:
+        yield batch
+
+def iter_chunk_ops(files, manifest, new_manifest, bm25_builder, stats, dedup=None):
+    """Lee un archivo a la vez, lo divide en chunks y genera las operaciones pendientes:
+    ("upsert", id, texto, metadatos) para chunks nuevos/modificados y
+    ("update", id, None, metadatos) cuando solo cambian los metadatos.
+    Con dedup, los casi duplicados de un chunk ya visto no se indexan."""
+    for file_path in files:
+        old_entry = manifest["files"].get(file_path.name, {})
+        
+        content = load_txt(file_path)
+        if content is None:
+            # Error de lectura: conservar lo que ya estaba indexado
+            if old_entry:
+                new_manifest["files"][file_path.name] = old_entry
+                stats["sources"][file_path.name] = {"chunks": len(old_entry.get("chunks", {})), "chars": 0}
+            print(f"  • {file_path.name}... ✗ (error)")
+            continue
+        
+        file_hash = hash_text(content)
+        chunks = dividir_en_chunks(content) if content else []
+        stats["sources"][file_path.name] = {"chunks": len(chunks), "chars": len(content)}
+        del content
+        old_chunks = old_entry.get("chunks", {})
+        entry = {"hash": file_hash, "chunks": {}, "duplicates": {}}
+        changed = 0
+        
+        for chunk_idx, fragmento in enumerate(chunks):
+            chunk = fragmento["text"]
+            chunk_id = f"{file_path.stem}_{chunk_idx}"
+            chunk_hash = hash_text(chunk)
+            metadata = {
+                "source": file_path.name,
+                "chunk": chunk_idx,
+                "total_chunks": len(chunks),
+                **metadatos_paginas(fragmento)
+            }
+            stats["chunks"] += 1
+            stats["chars"] += len(chunk)
+            
+            # Casi duplicado: se queda solo el canónico (si estaba indexado se borra abajo)
+            canonical = dedup.check(chunk_id, chunk, file_path.name) if dedup else None
+            if canonical is not None:
+                entry["duplicates"][chunk_id] = canonical
+                stats["duplicates"] += 1
+                continue
+            
+            entry["chunks"][chunk_id] = chunk_hash
+            bm25_builder.add(chunk_id, chunk)
+            
+            if old_chunks.get(chunk_id) != chunk_hash:
+                changed += 1
+                yield ("upsert", chunk_id, chunk, metadata)
+            elif old_entry.get("hash") != file_hash:
+                # Mismo texto pero el archivo cambió (p. ej. total_chunks o páginas): solo metadatos
+                yield ("update", chunk_id, None, metadata)
+        
+        removed = [chunk_id for chunk_id in old_chunks if chunk_id not in entry["chunks"]]
+        stats["delete_ids"].extend(removed)
+        stats["sources"][file_path.name]["chunks"] = len(entry["chunks"])
+        new_manifest["files"][file_path.name] = entry
+        
+        duplicados = f", {len(entry['duplicates'])} duplicados" if entry["duplicates"] else ""
+        if old_entry.get("hash") == file_hash and not changed and not removed:
+            print(f"  • {file_path.name}... ✓ sin cambios ({len(chunks)} fragmentos{duplicados})")
+        else:
+            print(f"  • {file_path.name}... ✓ ({len(chunks)} fragmentos, {changed} nuevos/modificados, {len(removed)} eliminados{duplicados})")
+
+def preprocess_embeddings(folder_path="./documentos", full_rebuild=False, batch_size=DEFAULT_BATCH_SIZE,
+                          backend=None):
+    """Procesa y guarda embeddings en ChromaDB de forma persistente.
+    Solo calcula embeddings de los chunks nuevos o modificados, y los
+    guarda en lotes de batch_size para que la memoria no crezca con el corpus.
+    backend: "chroma", "ollama", ... (por defecto ECOBOT_EMBEDDINGS); los textos
+    ya calculados con ese backend salen de la caché de embeddings.py."""
     
-    # Crear nueva colección
-    collection = client.create_collection(
-        name=collection_name,
-        metadata={"hnsw:space": "cosine"}
-    )
-    print("📚 Nueva colección creada")
+    print("🚀 Iniciando preprocesamiento de embeddings...")
     
-    # Procesar documentos
     folder = Path(folder_path)
     if not folder.exists():
         print(f"❌ La carpeta {folder_path} no existe")
         return 0
     
-    files = list(folder.glob("*.txt"))
+    files = sorted(folder.glob("*.txt"))
     if not files:
         print(f"❌ No se encontraron archivos TXT en {folder_path}")
         return 0
     
-    documents = []
-    metadatas = []
-    ids = []
+    # Conectar a ChromaDB (import diferido: la app importa este módulo solo por sus utilidades)
+    import chromadb
+    client = chromadb.PersistentClient(path="./chroma_db")
+    collection_name = "documentos_curso"
+    
+    manifest = None if full_rebuild else load_manifest()
     
-    print(f"📄 Procesando {len(files)} archivos...")
+    # Vectores de otro backend no son comparables con los nuevos: reconstruir
+    backend = normalizar_backend(backend or EMBEDDING_BACKEND)
+    try:
+        anterior = backend_de_coleccion(client.get_collection(collection_name))
+    except ValueError as e:
+        # Índice viejo con vectores de dimensión desconocida: no se puede seguir incrementalmente
+        print(f"♻️ {e}")
+        anterior, manifest = None, None
+    except Exception:
+        anterior = None
+    if manifest is not None and anterior not in (None, backend):
+        print(f"♻️ Cambio de embeddings ({anterior} → {backend}), se recalcula todo")
+        manifest = None
     
-    for file_path in files:
-        print(f"  • {file_path.name}...", end=" ", flush=True)
-        
-        content = load_txt(file_path)
-        if content:
-            chunks = chunk_text(content)
-            
-            for chunk_idx, chunk in enumerate(chunks):
-                documents.append(chunk)
-                metadatas.append({
-                    "source": file_path.name,
-                    "chunk": chunk_idx,
-                    "total_chunks": len(chunks)
-                })
-                ids.append(f"{file_path.stem}_{chunk_idx}")
-            
-            print(f"✓ ({len(chunks)} fragmentos)")
-        else:
-            print(f"✗ (error)")
-    
-    # Agregar a ChromaDB
-    if documents:
-        print(f"\n💾 Guardando {len(documents)} fragmentos en ChromaDB...")
-        collection.add(
-            documents=documents,
-            metadatas=metadatas,
-            ids=ids
-        )
-        print("✅ Embeddings guardados exitosamente")
-        
-        # Guardar hash
-        current_hash = get_documents_hash(folder_path)
-        if current_hash:
-            with open(".doc_hash", "w") as f:
-                f.write(current_hash)
-            print(f"📌 Hash guardado: {current_hash}")
+    # Sin manifiesto no se sabe qué contiene la colección: reconstruir desde cero
+    if manifest is None:
+        try:
+            client.delete_collection(collection_name)
+            print("♻️ Colección anterior eliminada")
+        except:
+            pass
+        manifest = {"files": {}}
+    
+    collection = client.get_or_create_collection(
+        name=collection_name,
+        metadata={"hnsw:space": "cosine", BACKEND_KEY: backend}
+    )
+    marcar_backend(collection, backend)
+    if collection.count() == 0:
+        manifest = {"files": {}}
+    embedder = CachedEmbedder(get_backend(backend))
+    print(f"🧠 Embeddings: {backend}")
+    
+    tracemalloc.start()
+    inicio = time.perf_counter()
+    
+    new_manifest = {"files": {}}
+    bm25_builder = BM25Builder()   # se llena mientras pasan los chunks (para BM25 e IDF)
+    dedup = NearDuplicateIndex()   # firmas MinHash de los chunks canónicos
+    stats = {"chunks": 0, "chars": 0, "upserted": 0, "updated": 0, "batches": 0, "duplicates": 0,
+             "delete_ids": [], "sources": {}}
+    
+    print(f"📄 Revisando {len(files)} archivos (lotes de {batch_size})...")
+    
+    # Pipeline: archivo → chunks → lote → embeddings + guardado en ChromaDB
+    ops = iter_chunk_ops(files, manifest, new_manifest, bm25_builder, stats, dedup)
+    for batch in iter_batches(ops, batch_size):
+        upserts = [op for op in batch if op[0] == "upsert"]
+        updates = [op for op in batch if op[0] == "update"]
         
-        return len(documents)
+        if upserts:
+            documents = [op[2] for op in upserts]
+            collection.upsert(
+                ids=[op[1] for op in upserts],
+                documents=documents,
+                embeddings=embedder.embed(documents),
+                metadatas=[op[3] for op in upserts]
+            )
+            stats["upserted"] += len(upserts)
+        if updates:
+            collection.update(
+                ids=[op[1] for op in updates],
+                metadatas=[op[3] for op in updates]
+            )
+            stats["updated"] += len(updates)
+        stats["batches"] += 1
+    
+    # Chunks de archivos modificados que sobran y archivos que ya no existen
+    delete_ids = stats["delete_ids"]
+    for name, old_entry in manifest["files"].items():
+        if name not in new_manifest["files"]:
+            delete_ids.extend(old_entry.get("chunks", {}).keys())
+            print(f"  • {name}... 🗑️ eliminado ({len(old_entry.get('chunks', {}))} fragmentos)")
+    for ids_batch in iter_batches(delete_ids, batch_size):
+        collection.delete(ids=ids_batch)
+    
+    # Fuentes alternativas de cada canónico ("" si ya no tiene duplicados: chromadb < 0.5 no
+    # acepta None en los metadatos, y quien lee trata "" como sin alternativas)
+    alt_sources = dedup.alt_sources()
+    indexed = {chunk_id for entry in new_manifest["files"].values() for chunk_id in entry["chunks"]}
+    alt_ids = [chunk_id for chunk_id in sorted(set(alt_sources) | set(manifest.get("alt_sources", {}))) if chunk_id in indexed]
+    for ids_batch in iter_batches(alt_ids, batch_size):
+        collection.update(ids=ids_batch, metadatas=[{"alt_sources": alt_sources.get(chunk_id, "")} for chunk_id in ids_batch])
+    new_manifest["alt_sources"] = alt_sources
+    
+    if stats["upserted"]:
+        print(f"\n✅ {stats['upserted']} fragmentos nuevos/modificados guardados en ChromaDB")
     else:
+        print("\n✅ No hay fragmentos nuevos que procesar")
+    if stats["updated"]:
+        print(f"📝 {stats['updated']} fragmentos con metadatos actualizados")
+    if delete_ids:
+        print(f"🗑️ {len(delete_ids)} fragmentos eliminados")
+    if stats["duplicates"]:
+        print(f"🧬 {stats['duplicates']} fragmentos casi duplicados no indexados ({len(alt_sources)} canónicos con fuentes alternativas)")
+    
+    # La fecha del manifiesto es la versión del índice (invalida las cachés de las apps y el
+    # banco del quiz): si no cambió nada no se reescribe
+    if json.loads(json.dumps(new_manifest)) != manifest:
+        save_manifest(new_manifest)
+    
+    if not bm25_builder.ids:
+        tracemalloc.stop()
         print("❌ No se procesaron documentos")
         return 0
+    
+    # Índice BM25 sobre los mismos chunks/ids para la búsqueda híbrida
+    bm25 = bm25_builder.build()
+    bm25.save(BM25_DIR)
+    print(f"🔎 Índice BM25 guardado en {BM25_DIR}")
+    
+    # Frecuencias IDF para el extractor local de keywords (las mismas del índice BM25)
+    KeywordExtractor.from_index(bm25).save(IDF_FILE)
+    print(f"🔑 IDF de keywords guardado en {IDF_FILE}")
+    
+    # Resumen del corpus para el sidebar de la app
+    save_corpus_stats(build_corpus_stats(stats["sources"], time.perf_counter() - inicio))
+    print(f"📈 Resumen del corpus guardado en {CORPUS_STATS_FILE}")
+    
+    # Consultas fijas de la app: sin embedding ni búsqueda vectorial al pulsar los botones
+    precomputed = build_precomputed_queries(collection, embedder=embedder)
+    save_precomputed_queries(precomputed)
+    print(f"⚡ {len(precomputed['queries'])} consultas fijas precalculadas en {PRECOMPUTED_FILE}")
+    
+    # Guardar hash
+    current_hash = get_documents_hash(folder_path)
+    if current_hash:
+        with open(".doc_hash", "w") as f:
+            f.write(current_hash)
+        print(f"📌 Hash guardado: {current_hash}")
+    
+    # Reporte de memoria y throughput
+    duracion = time.perf_counter() - inicio
+    _, pico = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+    print(f"\n📊 Reporte:")
+    print(f"   Fragmentos revisados:   {stats['chunks']} ({stats['chars'] / 1024:.0f} KB de texto)")
+    print(f"   Fragmentos guardados:   {stats['upserted']} en {stats['batches']} lotes")
+    print(f"   Embeddings calculados:  {embedder.misses} ({embedder.hits} desde la caché)")
+    print(f"   Casi duplicados:        {stats['duplicates']}")
+    print(f"   Tiempo total:           {duracion:.1f} s")
+    if stats["upserted"]:
+        print(f"   Throughput:             {stats['upserted'] / duracion:.1f} fragmentos/s")
+    print(f"   Pico de memoria Python: {pico / 1024 / 1024:.1f} MB")
+    
+    return len(bm25_builder.ids)
 
 if __name__ == "__main__":
-    count = preprocess_embeddings()
+    parser = argparse.ArgumentParser(description="Preprocesa los embeddings de documentos/ en ChromaDB")
+    parser.add_argument("--full", action="store_true", help="Borra la colección y recalcula todos los embeddings")
+    parser.add_argument("--batch-size", type=int, default=DEFAULT_BATCH_SIZE, help="Fragmentos por lote de embeddings/guardado")
+    parser.add_argument("--embeddings", default=None, help="Backend de embeddings: chroma, ollama, sentence-transformers o stub (opcional :modelo)")
+    args = parser.parse_args()
+    
+    count = preprocess_embeddings(full_rebuild=args.full, batch_size=args.batch_size, backend=args.embeddings)
     print(f"\n{'='*50}")
     print(f"✨ Preprocesamiento completado: {count} fragmentos")
     print(f"{'='*50}")
@@ -0,0 +1,360 @@
+"""
+Banco persistente de preguntas de quiz por tema (las consultas de
+CONSULTAS_QUIZ). Las preguntas se generan con Groq fuera del camino
+interactivo: de una vez con `python quiz_bank.py` y, en la app, con un hilo
+de fondo que repone los temas que bajan del mínimo. Empezar un quiz es solo
+sacar preguntas del banco que la sesión todavía no vio. El archivo guarda la
+versión del índice con que se generó: si el índice cambia, se descarta.
+"""
+
+import argparse
+import hashlib
+import json
+import os
+import random
+import threading
+from pathlib import Path
+
+from caches import normalizar_pregunta
+from contenido_curso import CONSULTAS_QUIZ
+from rate_limit import PRIORIDAD_FONDO
+
+QUIZ_BANK_FILE = "./chroma_db/quiz_bank.json"
+
+PREGUNTAS_POR_QUIZ = 5
+MIN_POR_TEMA = 10         # por debajo (sin contar las ya vistas por la sesión) se repone en segundo plano
+OBJETIVO_POR_TEMA = 20    # hasta cuántas se repone cada tema
+MAX_POR_TEMA = 100        # tope del archivo aunque las sesiones agoten el banco
+
+CONTEXTO_FRAGMENTOS = 5   # fragmentos de contexto por generación
+CONTEXTO_CANDIDATOS = 15  # se eligen al azar entre los primeros, para variar las preguntas
+
+QUIZ_MODEL = "llama-3.1-8b-instant"
+JSON_MODE = True          # response_format json_object (se desactiva solo si la API lo rechaza)
+
+PROMPT_QUIZ = """Basándote en el siguiente contexto sobre Integración Regional en Europa y América, genera exactamente 5 preguntas de opción múltiple ÚNICAS Y DIFERENTES en formato JSON.
+
+IMPORTANTE: Genera preguntas VARIADAS y ORIGINALES. No repitas preguntas comunes. Usa este número como inspiración para variar: {semilla}
+
+CONTEXTO:
+{contexto}
+
+Genera el JSON exactamente en este formato (sin markdown):
+{{
+    "preguntas": [
+        {{
+            "pregunta": "¿Pregunta sobre el tema?",
+            "opciones": ["A) Opción 1", "B) Opción 2", "C) Opción 3", "D) Opción 4"],
+            "respuesta_correcta": 0,
+            "explicacion": "Breve explicación de por qué es correcta"
+        }}
+    ]
+}}
+
+Asegúrate de:
+1. La respuesta correcta siempre es una de las opciones
+2. respuesta_correcta es el índice (0, 1, 2 o 3)
+3. Preguntas VARIADAS, CREATIVAS y educativas
+4. Explicaciones claras y útiles
+5. NO repetir las mismas preguntas típicas"""
+
+
+def id_pregunta(pregunta):
+    """Identificador estable de una pregunta (su texto normalizado)"""
+    return hashlib.sha1(normalizar_pregunta(pregunta["pregunta"]).encode("utf-8")).hexdigest()[:12]
+
+
+def validar_pregunta(pregunta):
+    """La pregunta tiene texto, 4 opciones, índice de respuesta 0-3 y explicación"""
+    return (
+        isinstance(pregunta, dict)
+        and isinstance(pregunta.get("pregunta"), str) and pregunta["pregunta"].strip() != ""
+        and isinstance(pregunta.get("opciones"), list) and len(pregunta["opciones"]) == 4
+        and all(isinstance(o, str) and o.strip() for o in pregunta["opciones"])
+        and type(pregunta.get("respuesta_correcta")) is int and pregunta["respuesta_correcta"] in (0, 1, 2, 3)
+        and isinstance(pregunta.get("explicacion"), str)
+    )
+
+
+class ParserPreguntas:
+    """Lee el JSON {"preguntas": [...]} a medida que llega y entrega cada pregunta
+    apenas se cierra su objeto. Las preguntas mal formadas se descartan una a una
+    (no invalidan el resto) y el texto fuera del objeto JSON se ignora."""
+
+    def __init__(self):
+        self._texto = []
+        self._pila = []        # corchetes abiertos: "{" o "["
+        self._inicio = None    # posición del objeto de la pregunta en curso
+        self._pos = 0
+        self._en_string = False
+        self._escape = False
+        self.descartadas = 0
+
+    def feed(self, fragmento):
+        """Procesa un trozo de texto y devuelve las preguntas válidas que completó"""
+        listas = []
+        for c in fragmento:
+            self._texto.append(c)
+            if self._en_string:
+                if self._escape:
+                    self._escape = False
+                elif c == "\\":
+                    self._escape = True
+                elif c == '"':
+                    self._en_string = False
+            elif c == '"' and self._pila:
+                self._en_string = True
+            elif c in "{[":
+                # Una pregunta es un objeto dentro de la lista del objeto raíz
+                if c == "{" and self._pila == ["{", "["]:
+                    self._inicio = self._pos
+                self._pila.append(c)
+            elif c in "}]" and self._pila:
+                self._pila.pop()
+                if c == "}" and self._inicio is not None and self._pila == ["{", "["]:
+                    pregunta = self._cerrar("".join(self._texto[self._inicio:self._pos + 1]))
+                    if pregunta is not None:
+                        listas.append(pregunta)
+                    self._inicio = None
+            self._pos += 1
+        return listas
+
+    def _cerrar(self, texto):
+        try:
+            pregunta = json.loads(texto)
+        except json.JSONDecodeError:
+            pregunta = None
+        if not validar_pregunta(pregunta):
+            self.descartadas += 1
+            return None
+        return pregunta
+
+
+def parsear_preguntas(texto):
+    """Preguntas válidas de una respuesta completa (las mal formadas se descartan)"""
+    return ParserPreguntas().feed(texto)
+
+
+def contexto_tema(collection, tema, n=CONTEXTO_FRAGMENTOS, candidatos=CONTEXTO_CANDIDATOS):
+    """Texto de n fragmentos al azar entre los más cercanos al tema.
+
+    Usa los candidatos precalculados al indexar (consultas fijas); si faltan,
+    consulta la colección con el embedder con que se construyó.
+    """
+    from preprocess_embeddings import load_precomputed_queries
+
+    precomputed = (load_precomputed_queries() or {}).get("queries", {}).get(normalizar_pregunta(tema))
+    if precomputed is not None:
+        ids = precomputed["ids"][:candidatos]
+    else:
+        from embeddings import CachedEmbedder, get_backend, backend_de_coleccion
+        embedder = CachedEmbedder(get_backend(backend_de_coleccion(collection)))
+        ids = collection.query(query_embeddings=[embedder.embed_query(tema)], n_results=candidatos,
+                               include=[])["ids"][0]
+    ids = random.sample(ids, min(n, len(ids)))
+    documentos = collection.get(ids=ids, include=["documents"])["documents"]
+    return "\n\n".join(documentos)
+
+
+def iter_preguntas(groq_client, collection, tema, prioridad=PRIORIDAD_FONDO):
+    """Pide a Groq un lote de preguntas sobre tema en modo JSON y entrega cada
+    pregunta válida apenas termina de llegar por el stream"""
+    global JSON_MODE
+    contexto = contexto_tema(collection, tema)
+    if not contexto.strip():
+        raise ValueError("El contexto recuperado está vacío")
+
+    kwargs = dict(
+        model=QUIZ_MODEL,
+        messages=[{"role": "user", "content": PROMPT_QUIZ.format(semilla=random.randint(1, 1000), contexto=contexto)}],
+        temperature=1.0,
+        max_tokens=1000
+    )
+    try:
+        stream = groq_client.stream(prioridad, **kwargs, **({"response_format": {"type": "json_object"}} if JSON_MODE else {}))
+    except Exception as e:
+        # 400 (BadRequestError) por el código de estado: el SDK de groq no se importa aquí
+        if not JSON_MODE or getattr(e, "status_code", None) != 400:
+            raise
+        # El modelo o la API no aceptan modo JSON con streaming: el parser tolera texto alrededor
+        print("⚠️ Quiz: modo JSON no disponible, se sigue sin response_format")
+        JSON_MODE = False
+        stream = groq_client.stream(prioridad, **kwargs)
+
+    parser = ParserPreguntas()
+    for chunk in stream:
+        if chunk.choices and chunk.choices[0].delta.content:
+            yield from parser.feed(chunk.choices[0].delta.content)
+    if parser.descartadas:
+        print(f"⚠️ Quiz: {parser.descartadas} preguntas mal formadas descartadas ({tema})")
+
+
+def generar_preguntas(groq_client, collection, tema, prioridad=PRIORIDAD_FONDO, on_pregunta=None):
+    """Lote de preguntas válidas sobre tema; si el stream se corta se quedan las que llegaron.
+    on_pregunta(n) se llama cada vez que se completa una."""
+    preguntas = []
+    try:
+        for pregunta in iter_preguntas(groq_client, collection, tema, prioridad):
+            preguntas.append(pregunta)
+            if on_pregunta is not None:
+                on_pregunta(len(preguntas))
+    except Exception as e:
+        if not preguntas:
+            raise
+        print(f"⚠️ Quiz: generación interrumpida con {len(preguntas)} preguntas ({e})")
+    return preguntas
+
+
+class QuizBank:
+    """Preguntas validadas por tema, guardadas en JSON; lo comparte todo el proceso.
+    version: versión del índice de las preguntas (None si no hay manifest)"""
+
+    def __init__(self, path=QUIZ_BANK_FILE, temas=None, version=None):
+        self.path = path
+        self.version = version
+        self.temas = list(temas or CONSULTAS_QUIZ)
+        self.preguntas = {tema: [] for tema in self.temas}   # tema -> [pregunta con "id"]
+        self._ids = set()
+        self._lock = threading.Lock()
+        self._hilo = None
+        self.generadas = 0    # preguntas agregadas por este proceso
+
+    @classmethod
+    def load(cls, path=QUIZ_BANK_FILE, temas=None, version=None):
+        """Banco guardado en path; vacío si no existe o es de otra versión del índice"""
+        bank = cls(path, temas, version)
+        try:
+            with open(path, "r", encoding="utf-8") as f:
+                data = json.load(f)
+        except FileNotFoundError:
+            return bank
+        except Exception as e:
+            print(f"⚠️ Banco de preguntas ilegible ({e}), se empieza vacío")
+            return bank
+        if data.get("version") != version:
+            # Preguntas de documentos que pueden haber cambiado o ya no estar en el índice
+            print("♻️ Banco de preguntas de otra versión del índice, se descarta")
+            return bank
+        for tema, preguntas in data.get("temas", {}).items():
+            if tema in bank.preguntas:
+                bank._agregar(tema, preguntas)
+        return bank
+
+    def save(self):
+        with self._lock:
+            data = {
+                "version": self.version,
+                "temas": {tema: list(preguntas) for tema, preguntas in self.preguntas.items()},
+            }
+        Path(self.path).parent.mkdir(parents=True, exist_ok=True)
+        tmp = f"{self.path}.{threading.get_ident()}.tmp"
+        with open(tmp, "w", encoding="utf-8") as f:
+            json.dump(data, f, ensure_ascii=False, indent=1)
+        os.replace(tmp, self.path)
+
+    def vaciar(self):
+        """Descarta todas las preguntas (el índice se reconstruyó) y guarda el banco vacío"""
+        with self._lock:
+            self.preguntas = {tema: [] for tema in self.temas}
+            self._ids.clear()
+        self.save()
+
+    def _agregar(self, tema, preguntas):
+        nuevas = 0
+        with self._lock:
+            for pregunta in preguntas:
+                if not validar_pregunta(pregunta) or len(self.preguntas[tema]) >= MAX_POR_TEMA:
+                    continue
+                pregunta = {**pregunta, "id": id_pregunta(pregunta)}
+                if pregunta["id"] in self._ids:
+                    continue
+                self._ids.add(pregunta["id"])
+                self.preguntas[tema].append(pregunta)
+                nuevas += 1
+        return nuevas
+
+    def agregar(self, tema, preguntas):
+        """Agrega las preguntas válidas y no repetidas de un tema y guarda; devuelve cuántas"""
+        nuevas = self._agregar(tema, preguntas)
+        if nuevas:
+            self.generadas += nuevas
+            self.save()
+        return nuevas
+
+    def disponibles(self, tema, vistas=()):
+        with self._lock:
+            return [p for p in self.preguntas[tema] if p["id"] not in vistas]
+
+    def sacar(self, n=PREGUNTAS_POR_QUIZ, vistas=()):
+        """n preguntas que la sesión no vio: de un tema al azar si alcanza, si no de varios"""
+        por_tema = {tema: self.disponibles(tema, vistas) for tema in self.temas}
+        completos = [tema for tema, preguntas in por_tema.items() if len(preguntas) >= n]
+        if completos:
+            return random.sample(por_tema[random.choice(completos)], n)
+        todas = [p for preguntas in por_tema.values() for p in preguntas]
+        return random.sample(todas, min(n, len(todas)))
+
+    def faltantes(self, vistas=()):
+        """Temas con menos de MIN_POR_TEMA preguntas sin ver que todavía admiten más"""
+        return [
+            tema for tema in self.temas
+            if len(self.disponibles(tema, vistas)) < MIN_POR_TEMA and len(self.preguntas[tema]) < MAX_POR_TEMA
+        ]
+
+    def rellenar_en_fondo(self, generar, vistas=()):
+        """Repone en un hilo de fondo los temas bajo el mínimo; generar(tema) -> [preguntas].
+        Si ya hay un hilo reponiendo no se lanza otro."""
+        vistas = set(vistas)
+        if not self.faltantes(vistas):
+            return None
+        with self._lock:
+            if self._hilo is not None and self._hilo.is_alive():
+                return self._hilo
+            self._hilo = threading.Thread(target=self.rellenar, args=(generar, vistas),
+                                          name="banco-quiz", daemon=True)
+            self._hilo.start()
+            return self._hilo
+
+    def rellenar(self, generar, vistas=(), objetivo=OBJETIVO_POR_TEMA, max_intentos=3):
+        """Genera preguntas para cada tema hasta tener objetivo sin ver (sin pasar de MAX_POR_TEMA)"""
+        for tema in self.temas:
+            intentos = 0
+            while (len(self.disponibles(tema, vistas)) < objetivo and len(self.preguntas[tema]) < MAX_POR_TEMA
+                   and intentos < max_intentos):
+                intentos += 1
+                try:
+                    nuevas = self.agregar(tema, generar(tema))
+                except Exception as e:
+                    print(f"⚠️ Banco de quiz: no se pudo generar '{tema}' ({e})")
+                    return
+                if nuevas:
+                    intentos = 0
+                print(f"📝 Banco de quiz: {tema} → {len(self.preguntas[tema])} preguntas (+{nuevas})")
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Llena el banco de preguntas del quiz con Groq")
+    parser.add_argument("--objetivo", type=int, default=OBJETIVO_POR_TEMA, help="Preguntas por tema")
+    args = parser.parse_args()
+
+    api_key = os.getenv("GROQ_API_KEY")
+    if not api_key:
+        raise SystemExit("❌ Define GROQ_API_KEY para generar preguntas")
+
+    import chromadb
+    from groq_client import AsyncGroqClient
+    from preprocess_embeddings import MANIFEST_FILE
+
+    collection = chromadb.PersistentClient(path="./chroma_db").get_collection("documentos_curso")
+    groq_client = AsyncGroqClient(api_key)
+    try:
+        # Versión del índice: la fecha del manifiesto, como en las apps
+        version = os.path.getmtime(MANIFEST_FILE)
+    except OSError:
+        version = None
+    bank = QuizBank.load(version=version)
+    print(f"🚀 Llenando el banco de preguntas ({args.objetivo} por tema)...")
+    bank.rellenar(lambda tema: generar_preguntas(groq_client, collection, tema), objetivo=args.objetivo)
+    groq_client.close()
+    total = sum(len(preguntas) for preguntas in bank.preguntas.values())
+    print(f"✅ {total} preguntas en {QUIZ_BANK_FILE} ({bank.generadas} nuevas)")
@@ -0,0 +1,197 @@
+"""
+Planificador de llamadas a Groq según sus límites de tasa. Peticiones y
+tokens por minuto se llevan como token buckets que se corrigen con los
+encabezados x-ratelimit-* de cada respuesta; las llamadas esperan turno en
+una cola por prioridad (el chat antes que el trabajo de fondo, como los quizzes).
+"""
+
+import asyncio
+import heapq
+import itertools
+import random
+import re
+import time
+
+RPM = 30                # peticiones por minuto del plan de Groq
+TPM = 6000              # tokens por minuto del plan de Groq
+PRIORIDAD_CHAT = 0      # respuestas que un estudiante está esperando
+PRIORIDAD_FONDO = 1     # generación de quizzes y otros trabajos que pueden esperar
+MAX_REINTENTOS = 4
+BACKOFF_BASE = 1.0      # segundos del primer reintento (se duplica en cada uno)
+BACKOFF_MAX = 30.0
+
+_DURACION = re.compile(r"(\d+(?:\.\d+)?)(ms|h|m|s)")
+
+
+def segundos(valor):
+    """Duración de un encabezado ("2m59.56s", "7.66s", "250ms", "12") en segundos; None si falta"""
+    if not valor:
+        return None
+    partes = _DURACION.findall(valor)
+    if not partes:
+        try:
+            return float(valor)
+        except ValueError:
+            return None
+    escala = {"h": 3600, "m": 60, "s": 1, "ms": 0.001}
+    return sum(float(n) * escala[unidad] for n, unidad in partes)
+
+
+def _entero(valor):
+    try:
+        return int(float(valor))
+    except (TypeError, ValueError):
+        return None
+
+
+def backoff(intento):
+    """Espera antes del reintento número intento (exponencial con jitter)"""
+    return min(BACKOFF_MAX, BACKOFF_BASE * 2 ** intento) * random.uniform(0.5, 1.5)
+
+
+class TokenBucket:
+    """Cupo que se recarga de forma continua; capacidad None = sin límite conocido"""
+
+    def __init__(self, capacidad, periodo=60):
+        self.capacidad = capacidad
+        self.periodo = periodo
+        self.tasa = capacidad / periodo if capacidad else None
+        self.nivel = capacidad
+        self._t = time.monotonic()
+
+    def _recargar(self):
+        ahora = time.monotonic()
+        if self.capacidad:
+            self.nivel = min(self.capacidad, self.nivel + (ahora - self._t) * self.tasa)
+        self._t = ahora
+
+    def espera(self, cantidad):
+        """Segundos hasta que haya cantidad disponible (0 si ya la hay)"""
+        if not self.capacidad:
+            return 0
+        self._recargar()
+        # Una petición más grande que el cupo entero pasa cuando está lleno
+        faltan = min(cantidad, self.capacidad) - self.nivel
+        return max(0.0, faltan / self.tasa)
+
+    def tomar(self, cantidad):
+        if self.capacidad:
+            self._recargar()
+            self.nivel -= cantidad
+
+    def ajustar(self, limite, restante, reset, reservado=0):
+        """Sincroniza con lo que informa el servidor (que también cuenta otros procesos).
+
+        reservado: lo tomado por peticiones que siguen en curso y el servidor
+        quizás todavía no descontó.
+        """
+        if limite:
+            if self.nivel is None:
+                self.nivel = limite
+            self.capacidad = limite
+        if self.capacidad:
+            self.tasa = self.capacidad / self.periodo
+        if restante is None or not self.capacidad:
+            return
+        self._recargar()
+        self.nivel = restante - reservado
+        # Recargar al ritmo que indica el servidor: lo que falta hasta el reset
+        if reset and restante < self.capacidad:
+            self.tasa = max(self.tasa, (self.capacidad - restante) / reset)
+
+
+class RateLimiter:
+    """Cola por prioridad frente a los límites de peticiones y tokens de Groq.
+
+    Vive en el event loop del cliente (groq_client.py), así que es uno por proceso.
+    """
+
+    def __init__(self, rpm=RPM, tpm=TPM):
+        self.rpm = TokenBucket(rpm)
+        self.tpm = TokenBucket(tpm)
+        self.rpd = TokenBucket(None, periodo=86400)   # peticiones por día, solo por encabezados
+        self.pausa_hasta = 0.0                        # tras un 429, nadie sale hasta esta hora
+        self.espera_total = 0.0                       # segundos que pasaron peticiones en cola
+        self.reintentos = 0                           # peticiones repetidas por 429 o errores de red
+        self._cola = []
+        self._orden = itertools.count()
+        self._en_curso = {}                           # turno -> tokens reservados
+        self._evento = asyncio.Event()
+
+    def _espera(self, tokens):
+        return max(
+            self.pausa_hasta - time.monotonic(),
+            self.rpm.espera(1),
+            self.rpd.espera(1),
+            self.tpm.espera(tokens),
+        )
+
+    def libre(self, tokens):
+        """Hay cupo ya mismo y nadie esperando (para decidir si vale la pena un intento extra)"""
+        return not self._cola and self._espera(tokens) <= 0
+
+    async def adquirir(self, tokens, prioridad=PRIORIDAD_CHAT):
+        """Espera turno (prioridad y luego orden de llegada) y cupo para una petición de ~tokens.
+
+        Devuelve el turno que hay que pasar a liberar() cuando llegue la respuesta.
+        """
+        entrada = (prioridad, next(self._orden))
+        heapq.heappush(self._cola, entrada)
+        inicio = time.monotonic()
+        try:
+            while True:
+                espera = None
+                if self._cola[0] == entrada:
+                    espera = self._espera(tokens)
+                    if espera <= 0:
+                        heapq.heappop(self._cola)
+                        self.rpm.tomar(1)
+                        self.rpd.tomar(1)
+                        self.tpm.tomar(tokens)
+                        self.espera_total += time.monotonic() - inicio
+                        self._en_curso[entrada] = tokens
+                        return entrada
+                await self._esperar(espera)
+        except BaseException:
+            # Cancelada mientras esperaba: salir de la cola y dejar pasar al siguiente
+            if entrada in self._cola:
+                self._cola.remove(entrada)
+                heapq.heapify(self._cola)
+            raise
+        finally:
+            self._avisar()
+
+    def liberar(self, turno, headers=None):
+        """Cierra el turno y corrige los cupos con los encabezados x-ratelimit-* de su respuesta"""
+        self._en_curso.pop(turno, None)
+        if headers:
+            # En Groq, el límite de peticiones de los encabezados es por día y el de tokens por minuto
+            self.rpd.ajustar(
+                _entero(headers.get("x-ratelimit-limit-requests")),
+                _entero(headers.get("x-ratelimit-remaining-requests")),
+                segundos(headers.get("x-ratelimit-reset-requests")),
+                reservado=len(self._en_curso),
+            )
+            self.tpm.ajustar(
+                _entero(headers.get("x-ratelimit-limit-tokens")),
+                _entero(headers.get("x-ratelimit-remaining-tokens")),
+                segundos(headers.get("x-ratelimit-reset-tokens")),
+                reservado=sum(self._en_curso.values()),
+            )
+        self._avisar()
+
+    def pausar(self, espera):
+        """Detiene todas las salidas durante espera segundos (respuesta 429)"""
+        self.pausa_hasta = max(self.pausa_hasta, time.monotonic() + espera)
+        self._avisar()
+
+    async def _esperar(self, timeout):
+        evento = self._evento
+        try:
+            await asyncio.wait_for(evento.wait(), timeout)
+        except asyncio.TimeoutError:
+            pass
+
+    def _avisar(self):
+        self._evento.set()
+        self._evento = asyncio.Event()